@@ -5,9 +5,13 @@ This module provides analytics tracking, reporting, and setup functionality.
 
 import json
 import os
+from collections import Counter
 from datetime import datetime
 from typing import Dict, Optional, Any, List
 import logging
+import queue
+import threading
+import orjson
 from dotenv import load_dotenv
 import requests
 import time
@@ -453,7 +457,7 @@ class GA4Analytics:
             # Always log in debug mode
             if self.debug:
                 logger.info(f"GA4 Event: {name}")
-                logger.info(f"Event Data: {json.dumps(event_data, ensure_ascii=False, indent=2)}")
+                logger.info(f"Event Data: {orjson.dumps(event_data, option=orjson.OPT_INDENT_2).decode()}")
             
             # In production, send the event
             if self.is_production:
@@ -609,6 +613,9 @@ class GA4Analytics:
         )
 
 class GA4Manager:
+    # Measurement Protocol accepts at most 25 events per request, all for one client
+    MAX_EVENTS_PER_REQUEST = 25
+    
     def __init__(self):
         """Initialize GA4 client."""
         self.measurement_id = os.getenv('GA4_MEASUREMENT_ID')
@@ -618,9 +625,15 @@ class GA4Manager:
         
         # Initialize session tracking
         self.user_sessions = {}  # {user_id: {'start_time': timestamp, 'depth': count, 'actions': [list]}}
-        self.feature_usage = {}  # {user_id: {feature: count}}
+        self.feature_usage = {}  # {user_id: Counter({feature: count})}
         self.session_counts = {}  # {user_id: count}
         
+        # Background sender, see start_background_sender()
+        self._event_queue: Optional[queue.Queue] = None
+        self._sender_thread: Optional[threading.Thread] = None
+        self._flush_interval = 1.0
+        self._batch_size = 20
+        
         if not self.measurement_id or not self.api_secret:
             logger.error("GA4 credentials not found in environment variables")
             raise ValueError("GA4_MEASUREMENT_ID and GA4_API_SECRET environment variables are required")
@@ -634,7 +647,7 @@ class GA4Manager:
         """Log event details for debugging."""
         if self.debug:
             logger.info(f"GA4 Event: {event_name}")
-            logger.info(f"Parameters: {json.dumps(params, ensure_ascii=False, indent=2)}")
+            logger.info(f"Parameters: {orjson.dumps(params, option=orjson.OPT_INDENT_2).decode()}")
         
         # Track the action
         if 'user_id' in params:
@@ -693,21 +706,18 @@ class GA4Manager:
             # Always log in debug mode
             if self.debug:
                 logger.info(f"GA4 Event: {name}")
-                logger.info(f"Event Data: {json.dumps(event_data, ensure_ascii=False, indent=2)}")
+                logger.info(f"Event Data: {orjson.dumps(event_data, option=orjson.OPT_INDENT_2).decode()}")
             
-            # In production, send the event
+            # In production, send the event (or hand it to the background sender)
             if self.is_production:
-                response = requests.post(
-                    self.base_url,
-                    json=event_data
-                )
-                
-                if response.status_code != 204:
-                    logger.error(f"Error sending event to GA4: {response.status_code} - {response.text}")
-                    return False
-                elif self.debug:
-                    logger.debug(f"Successfully sent event {name} to GA4")
-                return True
+                if self._event_queue is not None:
+                    try:
+                        self._event_queue.put_nowait(event_data)
+                    except queue.Full:
+                        logger.warning(f"GA4 event queue full, dropping event {name}")
+                        return False
+                    return True
+                return self._post_events(event_data)
             
             return True
                 
@@ -717,6 +727,92 @@ class GA4Manager:
                 self._handle_production_error(e)
             return False
 
+    def _post_events(self, event_data: Dict) -> bool:
+        """POST a Measurement Protocol payload to GA4."""
+        response = requests.post(
+            self.base_url,
+            json=event_data
+        )
+        
+        if response.status_code != 204:
+            logger.error(f"Error sending event to GA4: {response.status_code} - {response.text}")
+            return False
+        elif self.debug:
+            logger.debug(f"Successfully sent {len(event_data['events'])} event(s) to GA4")
+        return True
+
+    def start_background_sender(self, flush_interval: float = 1.0, batch_size: int = 20, max_queue_size: int = 10000) -> None:
+        """
+        Send events from a background thread in batches instead of inline.
+        Events are flushed every `flush_interval` seconds or once `batch_size` are queued;
+        when the queue is full new events are dropped rather than blocking the caller.
+        """
+        if self._sender_thread is not None:
+            return
+        self._flush_interval = flush_interval
+        self._batch_size = batch_size
+        self._event_queue = queue.Queue(maxsize=max_queue_size)
+        self._sender_thread = threading.Thread(target=self._run_sender, name="ga4-sender", daemon=True)
+        self._sender_thread.start()
+        logger.info("GA4 background sender started")
+
+    def stop_background_sender(self, timeout: float = 5.0) -> None:
+        """Flush queued events and stop the background sender."""
+        if self._sender_thread is None:
+            return
+        self._event_queue.put(None)  # Sentinel: flush and exit
+        self._sender_thread.join(timeout)
+        self._sender_thread = None
+        self._event_queue = None
+
+    def _run_sender(self) -> None:
+        """Drain the event queue, sending events in batches."""
+        event_queue = self._event_queue
+        while True:
+            first = event_queue.get()
+            if first is None:
+                return
+            
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self._flush_interval
+            while len(batch) < self._batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event_data = event_queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if event_data is None:
+                    stop = True
+                    break
+                batch.append(event_data)
+            
+            self._send_batch(batch)
+            if stop:
+                return
+
+    def _send_batch(self, batch: List[Dict]) -> None:
+        """Group queued payloads by client and send them in as few requests as possible."""
+        by_client = {}
+        for event_data in batch:
+            payload = by_client.setdefault(event_data['client_id'], {
+                "client_id": event_data['client_id'],
+                "user_id": event_data['user_id'],
+                "events": []
+            })
+            payload["events"].extend(event_data["events"])
+        
+        for payload in by_client.values():
+            events = payload["events"]
+            for start in range(0, len(events), self.MAX_EVENTS_PER_REQUEST):
+                try:
+                    self._post_events({**payload, "events": events[start:start + self.MAX_EVENTS_PER_REQUEST]})
+                except Exception as e:
+                    logger.error(f"Error sending event batch to GA4: {e}")
+                    self._handle_production_error(e)
+
     def track_search(self, user_id: str, query: str, results_count: int, success: bool) -> None:
         """Track search events with enhanced parameters."""
         params = {
@@ -888,10 +984,9 @@ class GA4Manager:
     def _get_feature_usage_count(self, user_id: str, feature: str) -> int:
         """Track how many times a user has used a feature."""
         user_id = str(user_id)
-        if user_id not in self.feature_usage:
-            self.feature_usage[user_id] = {}
-        self.feature_usage[user_id][feature] = self.feature_usage[user_id].get(feature, 0) + 1
-        return self.feature_usage[user_id][feature]
+        usage = self.feature_usage.setdefault(user_id, Counter())
+        usage[feature] += 1
+        return usage[feature]
 
     def _get_session_engagement_count(self, user_id: str) -> int:
         """Get the number of engagement events in the current session."""
@@ -912,15 +1007,6 @@ class GA4Manager:
         """Get the number of previous sessions for the user."""
         return self.session_counts.get(user_id, 0)
 
-    def _get_user_favorites(self, user_id: str) -> List[str]:
-        """Get the user's favorite publishers."""
-        try:
-            with open('data/favorites.json', 'r') as f:
-                favorites = json.load(f)
-                return favorites.get(str(user_id), [])
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
-
     def _get_interaction_source(self) -> str:
         """Determine the source of interaction."""
         return 'telegram'
@@ -943,17 +1029,6 @@ class GA4Manager:
         except (FileNotFoundError, json.JSONDecodeError):
             return 0
 
-    def _get_favorites_by_hall(self, favorites: List[str]) -> Dict[int, int]:
-        """Get distribution of favorites by hall."""
-        distribution = {}
-        for fav in favorites:
-            try:
-                hall_number = int(fav.split('_')[0])
-                distribution[hall_number] = distribution.get(hall_number, 0) + 1
-            except (ValueError, IndexError):
-                continue
-        return distribution
-
     def _get_performance_category(self, duration_ms: float) -> str:
         if duration_ms < 500:
             return 'fast'
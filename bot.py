@@ -1,20 +1,29 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import asyncio
+import json
 import logging
+import multiprocessing
 import os
-from typing import Final, Dict, List, Any, Optional
+import queue
+import threading
+from typing import Awaitable, Callable, Final
 from dotenv import load_dotenv
 from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
-    ReplyKeyboardMarkup,
-    ReplyKeyboardRemove
+    InputFile,
+    InputMediaPhoto
 )
 from telegram.constants import ParseMode
+from telegram.error import TelegramError
+from telegram.request import HTTPXRequest
 from telegram.ext import (
+    AIORateLimiter,
     Application,
+    BaseUpdateProcessor,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
@@ -23,20 +32,20 @@ from telegram.ext import (
     ConversationHandler,
 )
 import pytz
-from halls.hall_manager import HallManager
-from maps import MapManager
-import cairosvg  # For converting SVG to PNG
+from halls.hall_manager import HallManager, normalize_search_text
+from maps import MapManager, highlight_booths, rasterize_svg
+import orjson
 import telegram
 from favorites import FavoritesManager
 from analytics import GA4Manager
-import functools
 import time as time_module  # Rename import to avoid conflict
-from pathlib import Path
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from functools import wraps
+from functools import lru_cache, partial, wraps
+from logging.handlers import QueueHandler, QueueListener
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from email.message import EmailMessage
 import re  # Add this at the top with other imports
 
 # Enable logging
@@ -57,62 +66,143 @@ TOKEN: Final = os.getenv('BOT_TOKEN')
 # Initialize components
 IS_PRODUCTION: Final = os.getenv('RAILWAY_ENVIRONMENT') == 'production'
 GA4_DEBUG = os.getenv('GA4_DEBUG', 'false').lower() == 'true'
-hall_manager = HallManager()
-map_manager = MapManager()
-favorites_manager = FavoritesManager()
-analytics = GA4Manager()
-
-if not IS_PRODUCTION:
-    logger.warning(
-        "Running in development mode. GA4 events will be logged but not sent to GA4. "
-        "Set RAILWAY_ENVIRONMENT=production to enable GA4 tracking."
-    )
+TRACK_PERFORMANCE: Final = os.getenv('TRACK_PERFORMANCE', 'false').lower() == 'true'
+# Public HTTPS base URL; when set, Telegram pushes updates to us instead of being polled
+WEBHOOK_URL: Final = os.getenv('WEBHOOK_URL')
+# Optional self-hosted telegram-bot-api server (e.g. http://127.0.0.1:8081) to cut API round trips
+BOT_API_URL: Final = os.getenv('BOT_API_URL')
+
+# Set by init_components() when the bot starts, never at import: map render workers
+# re-run this module as __mp_main__ and must not load halls, favorites or analytics
+hall_manager: HallManager
+map_manager: MapManager
+favorites_manager: FavoritesManager
+analytics: GA4Manager
+# Hall data is static at runtime, so the publisher total only needs computing once
+TOTAL_PUBLISHERS: int
+PHOTO_CACHE_VERSION: str
+photo_file_ids: dict[str, str]
+
+# Logo sent with the /start intro; read once instead of on every /start
+with open("assets/image.png", "rb") as logo_file:
+    LOGO_BYTES: Final = logo_file.read()
+
+async def load_logo() -> InputFile:
+    """Get the logo for upload (when it has no cached file_id)."""
+    return InputFile(LOGO_BYTES, filename="logo.png")
+
+# Telegram file_ids of photos we've already uploaded, so repeat sends skip the upload
+# (and the render) across restarts. They're stored with the hall data version they
+# were rendered from, and dropped once the hall files change
+PHOTO_FILE_IDS_PATH: Final = "data/photo_file_ids.json"
+# Bump whenever map rendering changes (palette, overlay, layout) so stale photos are re-uploaded
+MAP_RENDER_VERSION: Final = 3
+
+def load_photo_file_ids() -> dict[str, str]:
+    """Load cached photo file_ids from disk, if they match the current hall data."""
+    try:
+        with open(PHOTO_FILE_IDS_PATH, "r") as f:
+            cached = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if cached.get("version") != PHOTO_CACHE_VERSION:
+        logger.info("Hall data or map rendering changed since photos were cached; discarding photo file_ids")
+        return {}
+    return cached.get("file_ids", {})
+
+def init_components() -> None:
+    """Load hall data, favorites, analytics and the photo cache for the bot process."""
+    global hall_manager, map_manager, favorites_manager, analytics
+    global TOTAL_PUBLISHERS, PHOTO_CACHE_VERSION, photo_file_ids
+    hall_manager = HallManager()
+    map_manager = MapManager()
+    favorites_manager = FavoritesManager()
+    analytics = GA4Manager()
+    TOTAL_PUBLISHERS = sum(hall_manager.hall_counts.values())
+    PHOTO_CACHE_VERSION = f"{hall_manager.data_version}-r{MAP_RENDER_VERSION}"
+    photo_file_ids = load_photo_file_ids()
+
+    if not IS_PRODUCTION:
+        logger.warning(
+            "Running in development mode. GA4 events will be logged but not sent to GA4. "
+            "Set RAILWAY_ENVIRONMENT=production to enable GA4 tracking."
+        )
 
-# Initialize handlers
-if os.getenv('DEBUG', 'false').lower() == 'true':
-    event_bus.subscribe(LoggingHandler())
+def start_log_listener() -> QueueListener:
+    """Hand log records to a background thread so handlers never block writing to stderr."""
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    log_listener = QueueListener(log_queue, *logging.getLogger().handlers, respect_handler_level=True)
+    logging.getLogger().handlers = [QueueHandler(log_queue)]
+    log_listener.start()
+    return log_listener
 
 # Add performance monitoring decorator
 def track_performance(func):
-    """Decorator to track function performance and errors."""
+    """
+    Decorator to track function performance and errors.
+    Only active with TRACK_PERFORMANCE=true; otherwise handlers run unwrapped
+    (errors still reach GA4 through error_handler).
+    """
+    if not TRACK_PERFORMANCE:
+        return func
+    
     @wraps(func)
     async def wrapper(update, context, *args, **kwargs):
-        start_time = time_module.time()
-        user_id = str(update.effective_user.id) if update and update.effective_user else "unknown"
-        
+        start = time_module.monotonic_ns()
         try:
-            result = await func(update, context, *args, **kwargs)
-            duration_ms = int((time_module.time() - start_time) * 1000)
-            
-            # Track performance
-            analytics.track_performance(
-                user_id=user_id,
-                operation=func.__name__,
-                duration_ms=duration_ms
-            )
-            return result
-            
-        except Exception as e:
-            duration_ms = int((time_module.time() - start_time) * 1000)
-            
-            # Track error
-            analytics.track_error(
-                user_id=user_id,
-                error_type=type(e).__name__,
-                error_message=str(e)
-            )
-            
-            # Track performance
+            return await func(update, context, *args, **kwargs)
+        finally:
+            # track_performance only enqueues; errors are reported once, by error_handler
+            user_id = str(update.effective_user.id) if update and update.effective_user else "unknown"
             analytics.track_performance(
                 user_id=user_id,
                 operation=func.__name__,
-                duration_ms=duration_ms
+                duration_ms=(time_module.monotonic_ns() - start) // 1_000_000
             )
-            
-            raise e
     
     return wrapper
 
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Runs updates from different users concurrently, but each user's own updates
+    one at a time, in order. The lock covers handler matching too, so a
+    ConversationHandler always sees the state left by the user's previous update.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._user_locks: dict[int, asyncio.Lock] = {}
+        self._user_lock_holders: dict[int, int] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[object]) -> None:
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            await coroutine
+            return
+        
+        user_id = user.id
+        lock = self._user_locks.setdefault(user_id, asyncio.Lock())
+        self._user_lock_holders[user_id] = self._user_lock_holders.get(user_id, 0) + 1
+        try:
+            async with lock:
+                await coroutine
+        finally:
+            # Drop the lock once nobody is holding or waiting on it
+            self._user_lock_holders[user_id] -= 1
+            if not self._user_lock_holders[user_id]:
+                del self._user_lock_holders[user_id]
+                del self._user_locks[user_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+def log_exception(error: BaseException) -> None:
+    """Log an exception with its full traceback (run in an executor thread)."""
+    logger.error("Exception while handling an update:", exc_info=error)
+
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Log the error and send a message to the user if possible."""
     error = context.error
@@ -127,20 +217,88 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
         )
     
     # Handle old callback queries silently
-    if isinstance(error, telegram.error.BadRequest) and "Query is too old" in str(error):
+    if isinstance(error, telegram.error.BadRequest) and QUERY_TOO_OLD_ERROR in error.message:
         return
     
-    # For other errors, log them and notify the user
-    logger.error("Exception while handling an update:", exc_info=error)
+    # For other errors, log a one-liner now and format the traceback off the event loop
+    update_id = update.update_id if isinstance(update, Update) else None
+    logger.warning(f"{error.__class__.__name__} while handling update {update_id}")
+    asyncio.get_running_loop().run_in_executor(None, log_exception, error)
     
     if isinstance(update, Update) and update.effective_message:
         error_message = "عذراً، حدث خطأ. الرجاء المحاولة مرة أخرى."
         await update.effective_message.reply_text(error_message)
 
 
+class OrjsonHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest that parses Bot API responses (getUpdates included) with orjson."""
+
+    @staticmethod
+    def parse_json_payload(payload: bytes) -> dict:
+        try:
+            return orjson.loads(payload)
+        except orjson.JSONDecodeError as exc:
+            logger.error(f"Can not load invalid JSON data: {payload[:200]!r}")
+            raise TelegramError("Invalid server response") from exc
+
+class StaticInlineKeyboardMarkup(InlineKeyboardMarkup):
+    """
+    InlineKeyboardMarkup for keyboards that never change.
+    Its dict form is built once, so PTB doesn't walk the buttons again on every send.
+    """
+
+    __slots__ = ("_static_dict",)
+
+    def __init__(self, inline_keyboard, *, api_kwargs=None):
+        super().__init__(inline_keyboard, api_kwargs=api_kwargs)
+        # Protected attributes may be set on frozen TelegramObjects
+        self._static_dict = super().to_dict()
+
+    def to_dict(self, recursive: bool = True) -> dict:
+        if recursive:
+            return self._static_dict
+        return super().to_dict(recursive=recursive)
+
+
 # ------------------------------------------------------------------------
 # 1. Helper function to show the *home page* (main menu)
 # ------------------------------------------------------------------------
+# The home page content is static, so build it once (after the hall data is loaded)
+@lru_cache(maxsize=None)
+def home_intro_text() -> str:
+    """Build the /start intro caption (it includes the publisher total from the hall data)."""
+    return (
+        "أكبر وأقدم معرض للكتاب في العالم العربي؛ ويقدم آلاف العناوين في مختلف المجالات؛ يجمع مئات دور النشر من مختلف أنحاء العالم \n"
+        "📍 موقع المعرض: مركز مصر للمعارض الدولية \n"
+        "🏛 عدد القاعات: 5 قاعات \n"
+        f"📚 عدد دور النشر: {TOTAL_PUBLISHERS} دار \n"
+    )
+
+HOME_MENU_TEXT: Final = (
+    "مرحباً!* أنا «نديم»، بوت ذكي لمعرض القاهرة الدولي للكتاب 2025* \n\n"
+    "سأساعدك في:\n"
+    "🔍 البحث عن دور النشر والعناوين \n"
+    "🗺 معرفة أماكن الأجنحة بدقة على خرائط المعرض \n"
+    "⭐ حفظ مفضّلاتك والعودة إليها لاحقاً \n"
+    "📝 اختر من القائمة أدناه أو اكتب اسم الناشر/رقم الجناح مباشرة \n\n"
+    "-----------------------------------\n"
+    "🌐 زوروا موقعنا: https://asfar.io/"
+)
+
+HOME_MENU_MARKUP: Final = StaticInlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("🔍 البحث عن ناشر", callback_data="search"),
+        InlineKeyboardButton("🗺 خريطة المعرض", callback_data="maps")
+    ],
+    [
+        InlineKeyboardButton("⭐️ المفضلة", callback_data="favorites"),
+        InlineKeyboardButton("📅 العروض", callback_data="events")
+    ],
+    [
+        InlineKeyboardButton("🐛 الإبلاغ عن مشكلة", callback_data="report_bug")
+    ]
+])
+
 async def show_homepage(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Displays the main (home) menu with the same text/buttons as /start.
@@ -152,55 +310,22 @@ async def show_homepage(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     
     # Show intro and logo only if this is a /start command (not a callback)
     if update.message:
-        total_publishers = sum(len(hall_manager.get_hall_publishers(i)) for i in range(1, 6))
-        intro_text = (
-            "أكبر وأقدم معرض للكتاب في العالم العربي؛ ويقدم آلاف العناوين في مختلف المجالات؛ يجمع مئات دور النشر من مختلف أنحاء العالم \n"
-            "📍 موقع المعرض: مركز مصر للمعارض الدولية \n"
-            "🏛 عدد القاعات: 5 قاعات \n"
-            f"📚 عدد دور النشر: {total_publishers} دار \n"
-        )
-        
         # Send logo with intro text as caption
-        with open("assets/image.png", "rb") as photo:
-            await target_message.reply_photo(
+        await send_photo_cached(
+            "logo",
+            lambda photo: target_message.reply_photo(
                 photo=photo,
-                caption=intro_text,
+                caption=home_intro_text(),
                 parse_mode=ParseMode.MARKDOWN
-            )
-
-    # Build the main menu keyboard
-    keyboard = [
-        [
-            InlineKeyboardButton("🔍 البحث عن ناشر", callback_data="search"),
-            InlineKeyboardButton("🗺 خريطة المعرض", callback_data="maps")
-        ],
-        [
-            InlineKeyboardButton("⭐️ المفضلة", callback_data="favorites"),
-            InlineKeyboardButton("📅 العروض", callback_data="events")
-        ],
-        [
-            InlineKeyboardButton("🐛 الإبلاغ عن مشكلة", callback_data="report_bug")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    # Main menu text
-    text = (
-        "مرحباً!* أنا «نديم»، بوت ذكي لمعرض القاهرة الدولي للكتاب 2025* \n\n"
-        "سأساعدك في:\n"
-        "🔍 البحث عن دور النشر والعناوين \n"
-        "🗺 معرفة أماكن الأجنحة بدقة على خرائط المعرض \n"
-        "⭐ حفظ مفضّلاتك والعودة إليها لاحقاً \n"
-        "📝 اختر من القائمة أدناه أو اكتب اسم الناشر/رقم الجناح مباشرة \n\n"
-        "-----------------------------------\n"
-        "🌐 زوروا موقعنا: https://asfar.io/"
-    )
+            ),
+            load_logo
+        )
 
     # Send the home page message as text
     await target_message.reply_text(
-        text=text,
+        text=HOME_MENU_TEXT,
         parse_mode=ParseMode.MARKDOWN,
-        reply_markup=reply_markup
+        reply_markup=HOME_MENU_MARKUP
     )
 
 
@@ -259,14 +384,36 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 # ------------------------------------------------------------------------
 # 3. General Message Handler (search logic, etc.)
 # ------------------------------------------------------------------------
+# Booth codes look like "A74" or "B29"
+PUBLISHER_CODE_RE: Final = re.compile(r"[A-Za-z]\d{1,3}")
+
+NO_RESULTS_TEXT: Final = (
+    "عذراً، لم أجد أي دار نشر تطابق بحثك. حاول مرة أخرى باستخدام:\n"
+    "• اسم الناشر بالعربية أو الإنجليزية\n"
+    "• كود الجناح (مثال: A74)\n"
+    "• رقم القاعة (مثال: قاعة 1)"
+)
+
 @track_performance
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle incoming messages (likely publisher searches)."""
     text = update.message.text.strip()
     user_id = str(update.effective_user.id)
     
+    # Search is a substring match on normalized names, so text still longer than every
+    # one of them after normalizing can't match anything; skip the search and analytics
+    if len(normalize_search_text(text)) > hall_manager.max_search_length:
+        await update.message.reply_text(NO_RESULTS_TEXT)
+        return
+    
+    # Exact booth codes are answered from the code index; anything else is a full search
+    results = []
+    if PUBLISHER_CODE_RE.fullmatch(text):
+        results = hall_manager.get_publishers_by_code(text)
+    if not results:
+        results = hall_manager.search_publishers(text)
+    
     # Track search with enhanced parameters
-    results = hall_manager.search_publishers(text)
     analytics.track_search(
         user_id=user_id,
         query=text,
@@ -275,12 +422,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     )
     
     if not results:
-        await update.message.reply_text(
-            "عذراً، لم أجد أي دار نشر تطابق بحثك. حاول مرة أخرى باستخدام:\n"
-            "• اسم الناشر بالعربية أو الإنجليزية\n"
-            "• كود الجناح (مثال: A74)\n"
-            "• رقم القاعة (مثال: قاعة 1)"
-        )
+        await update.message.reply_text(NO_RESULTS_TEXT)
         return
 
     # If we have multiple results, show them as a list
@@ -290,30 +432,25 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         # Single result, show detailed info
         await handle_publisher_selection(update, context, results[0], is_callback=False)
 
-async def show_search_results(update: Update, results: List[Dict]) -> None:
+async def show_search_results(update: Update, results: list[dict]) -> None:
     """Show a list of search results with interactive buttons."""
-    response = "*نتائج البحث:*\n\n"
-    for i, pub in enumerate(results, 1):
-        response += f"{i}. *{pub.get('nameAr', 'بدون اسم')}*\n"
-        response += f"   🏷️ الكود: `{pub.get('code', 'غير متوفر')}`\n"
-        response += f"   🏛 القاعة: {pub.get('hall', 'غير متوفر')}\n\n"
-    
-    response += "*اضغط على زر الناشر المطلوب لعرض التفاصيل* 👇"
+    # Every publisher has a code and hall; only the name may be missing
+    response = "*نتائج البحث:*\n\n" + "".join(
+        f"{i}. *{pub.get('nameAr', 'بدون اسم')}*\n"
+        f"   🏷️ الكود: `{pub['code']}`\n"
+        f"   🏛 القاعة: {pub['hall']}\n\n"
+        for i, pub in enumerate(results, 1)
+    ) + "*اضغط على زر الناشر المطلوب لعرض التفاصيل* 👇"
     
     # Create keyboard with 2 buttons per row
-    keyboard = []
-    row = []
-    for pub in results:
-        button = InlineKeyboardButton(
-            f"{pub.get('code', '??')} - {pub.get('nameAr', 'بدون اسم')}",
-            callback_data=f"pub_{pub.get('hall')}_{pub.get('code', '')}"
+    buttons = [
+        InlineKeyboardButton(
+            f"{pub['code']} - {pub.get('nameAr', 'بدون اسم')}",
+            callback_data=f"pub_{pub['hall']}_{pub['code']}"
         )
-        row.append(button)
-        if len(row) == 2:
-            keyboard.append(row)
-            row = []
-    if row:
-        keyboard.append(row)
+        for pub in results
+    ]
+    keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
     
     await update.message.reply_text(
         response,
@@ -321,36 +458,47 @@ async def show_search_results(update: Update, results: List[Dict]) -> None:
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
+@lru_cache(maxsize=None)
+def adjacent_publishers_text(hall_number: int, section: str, code: str) -> str:
+    """Format a publisher's adjacent booths; the hall data is static, so each is built once."""
+    adjacent_pubs = hall_manager.get_adjacent_publishers(hall_number, section, code)
+    if not adjacent_pubs:
+        return ""
+    return "\n\n*الأجنحة المجاورة:* 📍\n" + "\n".join(
+        f"• {adj_pub.get('nameAr', 'بدون اسم')} ({adj_pub.get('code', '??')})"
+        for adj_pub in adjacent_pubs
+    )
+
 async def handle_publisher_selection(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
-    publisher: Dict,
-    is_callback: bool = False
+    publisher: dict,
+    is_callback: bool = False,
+    is_favorite: bool | None = None
 ) -> None:
-    """Handle when a user selects a publisher from the search list."""
+    """
+    Handle when a user selects a publisher from the search list.
+    Pass `is_favorite` when the caller already knows the favorite status.
+    """
     try:
         logger.info(f"Handling publisher selection: {publisher.get('code')} in hall {publisher.get('hall')}")
         
         # Get publisher info with enhanced format
         info = hall_manager.format_publisher_info(publisher)
         
-        # Get adjacent publishers
+        # Add adjacent publishers
         hall_number = publisher['hall']
         section = publisher.get('section')
         if section:
-            adjacent_pubs = hall_manager.get_adjacent_publishers(hall_number, section, publisher['code'])
-            if adjacent_pubs:
-                info += "\n\n*الأجنحة المجاورة:* 📍\n"
-                for adj_pub in adjacent_pubs:
-                    info += f"• {adj_pub.get('nameAr', 'بدون اسم')} ({adj_pub.get('code', '??')})\n"
+            info += adjacent_publishers_text(hall_number, section, publisher['code'])
         
         # Create composite key for favorites
         composite_key = f"{hall_number}_{publisher['code']}"
         
         # Check if publisher is in favorites
-        user_id = update.effective_user.id
-        user_favorites = favorites_manager.get_user_favorites(user_id)
-        is_favorite = composite_key in user_favorites
+        if is_favorite is None:
+            user_favorites = favorites_manager.get_user_favorites(update.effective_user.id)
+            is_favorite = composite_key in user_favorites
         logger.info(f"Favorite status for {composite_key}: {is_favorite}")
         
         # Create navigation buttons
@@ -380,7 +528,9 @@ async def handle_publisher_selection(
                     info,
                     InlineKeyboardMarkup(keyboard)
                 )
-            except Exception as e:
+            except telegram.error.BadRequest as e:
+                # safe_edit_message already handles unchanged/media messages; anything else
+                # Telegram rejects gets a fresh message instead
                 logger.error(f"Error updating message: {e}", exc_info=True)
                 await update.callback_query.message.reply_text(
                     text=info,
@@ -396,28 +546,39 @@ async def handle_publisher_selection(
             
     except Exception as e:
         logger.error(f"Error in handle_publisher_selection: {e}", exc_info=True)
-        error_message = "عذراً، حدث خطأ أثناء عرض معلومات الناشر"
+        error_message = ERROR_PUBLISHER_VIEW
         if is_callback:
             await safe_edit_message(
                 update.callback_query,
                 error_message,
-                InlineKeyboardMarkup(create_home_button())
+                HOME_MARKUP
             )
         else:
             await update.message.reply_text(
                 error_message,
-                reply_markup=InlineKeyboardMarkup(create_home_button())
+                reply_markup=HOME_MARKUP
             )
 
 
 # ------------------------------------------------------------------------
 # Helper Functions
 # ------------------------------------------------------------------------
-def create_home_button() -> List[List[InlineKeyboardButton]]:
+def create_home_button() -> list[list[InlineKeyboardButton]]:
     """Create a keyboard row with a home button."""
     return [[InlineKeyboardButton("عودة للقائمة الرئيسية", callback_data="start")]]
 
-def create_nav_buttons(current: int, total: int) -> List[InlineKeyboardButton]:
+# Markups are immutable, so the home button markup can be shared by every reply
+HOME_MARKUP: Final = StaticInlineKeyboardMarkup(create_home_button())
+
+# Error messages shared by several handlers
+ERROR_MAP_UNAVAILABLE: Final = "عذراً، لا يمكن عرض الخريطة حالياً"
+ERROR_LOCATION_UNAVAILABLE: Final = "عذراً، لا يمكن عرض الموقع حالياً"
+ERROR_PUBLISHER_NOT_FOUND: Final = "عذراً، لم يتم العثور على الناشر"
+ERROR_PUBLISHER_VIEW: Final = "عذراً، حدث خطأ أثناء عرض معلومات الناشر"
+ERROR_LOCATION_VIEW: Final = "عذراً، حدث خطأ أثناء عرض موقع الناشر"
+ERROR_UNEXPECTED: Final = "عذراً، حدث خطأ غير متوقع"
+
+def create_nav_buttons(current: int, total: int) -> list[InlineKeyboardButton]:
     """Create navigation buttons for halls/sections."""
     nav_row = []
     if current > 1:
@@ -426,6 +587,144 @@ def create_nav_buttons(current: int, total: int) -> List[InlineKeyboardButton]:
         nav_row.append(InlineKeyboardButton("التالي ▶️", callback_data=f"hall_{current + 1}"))
     return nav_row
 
+@lru_cache(maxsize=None)
+def hall_map_markup(hall_number: int) -> InlineKeyboardMarkup:
+    """Build a hall map's keyboard (sections, hall navigation, home); static per hall."""
+    # Section buttons, 2 per row
+    buttons = [
+        InlineKeyboardButton(
+            f"قسم {section} ({len(hall_manager.get_section_publishers(hall_number, section))})",
+            callback_data=f"section_{hall_number}_{section}"
+        )
+        for section in map_manager.get_hall_info(hall_number)["sections"]
+    ]
+    keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+    
+    # Add navigation buttons
+    nav_row = create_nav_buttons(hall_number, len(map_manager.halls))
+    if nav_row:
+        keyboard.append(nav_row)
+    
+    # Add home buttons
+    keyboard.append([
+        InlineKeyboardButton("عودة لقائمة القاعات", callback_data="maps"),
+        InlineKeyboardButton("القائمة الرئيسية", callback_data="start")
+    ])
+    return StaticInlineKeyboardMarkup(keyboard)
+
+# Rasterizing a map takes tens of ms, mostly pure-Python SVG parsing that holds
+# the GIL, so it runs in worker processes, started by main() rather than at import.
+# Workers come from a forkserver (spawn where there is none, e.g. Windows), never
+# forked from this threaded process mid-event-loop. Either way each worker re-runs
+# this module as __mp_main__, which only defines things: the bot's state is built
+# by init_components() in main(), and the render functions live in maps.py
+render_context: multiprocessing.context.BaseContext | None = None
+render_pool: ProcessPoolExecutor | None = None
+
+def new_render_pool() -> ProcessPoolExecutor:
+    """Create the worker pool that rasterizes hall maps."""
+    return ProcessPoolExecutor(max_workers=2, mp_context=render_context)
+
+def start_render_pool() -> None:
+    """Pick the worker start method and create render_pool."""
+    global render_context, render_pool
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        render_context = multiprocessing.get_context("forkserver")
+        render_context.set_forkserver_preload(["maps"])
+    else:
+        render_context = multiprocessing.get_context("spawn")
+    render_pool = new_render_pool()
+
+def submit_render(fn, *args) -> Future:
+    """Submit work to render_pool, replacing the pool if a dead worker broke it."""
+    global render_pool
+    try:
+        return render_pool.submit(fn, *args)
+    except BrokenProcessPool:
+        logger.warning("Map render pool is broken (a worker died); starting a new one")
+        render_pool.shutdown(wait=False, cancel_futures=True)
+        render_pool = new_render_pool()
+        return render_pool.submit(fn, *args)
+
+@lru_cache(maxsize=256)
+def submit_hall_render(hall_number: int, highlight_code: str | None = None) -> Future | None:
+    """Start rendering a hall map in render_pool; the future is cached per (hall, highlighted booth)."""
+    publishers = hall_manager.get_hall_publishers(hall_number)
+    svg_content = map_manager.create_hall_map(hall_number, publishers)
+    if not svg_content:
+        return None
+    if highlight_code is None:
+        return submit_render(rasterize_svg, svg_content)
+    # A booth's location map is the base map plus an overlay, not a second SVG render
+    boxes = map_manager.get_booth_boxes(publishers, highlight_code)
+    if not boxes:
+        # A faded map with nothing highlighted would only mislead; report it as unavailable
+        logger.warning(f"No booth {highlight_code} to highlight in hall {hall_number}")
+        return None
+    return submit_render(highlight_booths, svg_content, boxes)
+
+async def render_hall_png_async(hall_number: int, highlight_code: str | None = None) -> bytes | None:
+    """Render a hall map as PNG bytes without blocking the event loop."""
+    # One retry: a render lost to a dead worker is resubmitted to a fresh pool
+    for attempt in range(2):
+        future = submit_hall_render(hall_number, highlight_code)
+        if future is None:
+            return None
+        try:
+            return await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            submit_hall_render.cache_clear()
+            if attempt:
+                raise
+        except Exception:
+            # Don't keep serving a failed render from the cache
+            submit_hall_render.cache_clear()
+            raise
+
+def save_photo_file_ids() -> None:
+    """Write the cached photo file_ids to disk."""
+    try:
+        with open(PHOTO_FILE_IDS_PATH, "w") as f:
+            json.dump({"version": PHOTO_CACHE_VERSION, "file_ids": photo_file_ids}, f)
+    except OSError as e:
+        logger.warning(f"Could not save photo file_ids: {e}")
+
+def remember_photo_file_id(cache_key: str, message: telegram.Message) -> None:
+    """Store the file_id Telegram assigned to an uploaded photo for later reuse."""
+    if cache_key in photo_file_ids or not message.photo:
+        return
+    photo_file_ids[cache_key] = message.photo[-1].file_id
+    save_photo_file_ids()
+
+async def send_photo_cached(
+    cache_key: str,
+    send: Callable[[str | bytes | InputFile], Awaitable[telegram.Message]],
+    load: Callable[[], Awaitable[bytes | InputFile | None]]
+) -> telegram.Message | None:
+    """
+    Send a photo by its cached file_id, or upload the one `load()` returns when
+    there's none or Telegram rejects it (e.g. after a token or Bot API server
+    change). Returns None if `load()` has no photo either.
+    """
+    if file_id := photo_file_ids.get(cache_key):
+        try:
+            return await send(file_id)
+        except telegram.error.BadRequest as e:
+            logger.warning(f"Cached photo {cache_key} was rejected ({e.message}); uploading it again")
+            if photo_file_ids.pop(cache_key, None) is not None:
+                save_photo_file_ids()
+    photo = await load()
+    if photo is None:
+        return None
+    sent = await send(photo)
+    remember_photo_file_id(cache_key, sent)
+    return sent
+
+# Bot API error descriptions we handle specially (matched against TelegramError.message)
+QUERY_TOO_OLD_ERROR: Final = "Query is too old"
+NOT_MODIFIED_ERROR: Final = "Message is not modified"
+NOT_EDITABLE_ERRORS: Final = ("Message to edit not found", "There is no text in the message to edit")
+
 async def safe_delete_message(message: telegram.Message) -> None:
     """Safely delete a message, ignoring common errors."""
     try:
@@ -433,6 +732,17 @@ async def safe_delete_message(message: telegram.Message) -> None:
     except telegram.error.BadRequest:
         pass
 
+async def replace_message(message: telegram.Message, send: Awaitable[telegram.Message]) -> telegram.Message:
+    """Delete `message` while its replacement is being sent; returns the new message."""
+    # gather (not a TaskGroup) so a failed delete never cancels the send, and
+    # callers see the send's own TelegramError rather than an ExceptionGroup
+    deleted, sent = await asyncio.gather(safe_delete_message(message), send, return_exceptions=True)
+    if isinstance(deleted, Exception):
+        logger.warning(f"Could not delete message {message.message_id}: {deleted}")
+    if isinstance(sent, BaseException):
+        raise sent
+    return sent
+
 async def safe_edit_message(query: telegram.CallbackQuery, text: str, reply_markup: InlineKeyboardMarkup = None):
     """Safely edit or send a new message if the original is a photo/caption."""
     try:
@@ -442,20 +752,50 @@ async def safe_edit_message(query: telegram.CallbackQuery, text: str, reply_mark
             parse_mode=ParseMode.MARKDOWN
         )
     except telegram.error.BadRequest as e:
-        if "Message is not modified" in str(e):
+        if NOT_MODIFIED_ERROR in e.message:
             pass  # The text is identical
-        elif ("Message to edit not found" in str(e)
-              or "There is no text in the message to edit" in str(e)):
+        elif any(error in e.message for error in NOT_EDITABLE_ERRORS):
             # The original message is probably media; delete & send a new one
-            await safe_delete_message(query.message)
-            await query.message.reply_text(
+            await replace_message(query.message, query.message.reply_text(
                 text=text,
                 parse_mode=ParseMode.MARKDOWN,
                 reply_markup=reply_markup
-            )
+            ))
         else:
             raise
 
+async def safe_edit_photo(
+    query: telegram.CallbackQuery,
+    photo: str | bytes,
+    caption: str,
+    reply_markup: InlineKeyboardMarkup
+) -> telegram.Message:
+    """
+    Show `photo` in place of the query's message: swap the media in one call when
+    that message is already a photo, otherwise delete it and send a new one.
+    """
+    if query.message.photo:
+        try:
+            return await query.edit_message_media(
+                media=InputMediaPhoto(photo, caption=caption, parse_mode=ParseMode.MARKDOWN),
+                reply_markup=reply_markup
+            )
+        except telegram.error.BadRequest as e:
+            if NOT_MODIFIED_ERROR in e.message:
+                return query.message  # The same map is already shown
+            if not any(error in e.message for error in NOT_EDITABLE_ERRORS):
+                raise
+    return await replace_message(query.message, query.message.reply_photo(
+        photo=photo,
+        caption=caption,
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=reply_markup
+    ))
+
+async def send_error(query: telegram.CallbackQuery, text: str = ERROR_UNEXPECTED) -> None:
+    """Replace the current message with an error and a home button."""
+    await safe_edit_message(query, text, HOME_MARKUP)
+
 async def track_feature_engagement(context: ContextTypes.DEFAULT_TYPE, user_id: str, new_feature: str) -> None:
     """Track feature engagement time and update context."""
     prev_feature = context.user_data.get('current_feature', 'start')
@@ -477,266 +817,252 @@ async def track_feature_engagement(context: ContextTypes.DEFAULT_TYPE, user_id:
         
         # Track engagement time
         if 'feature_start_time' in context.user_data:
-            duration = time_module.time() - context.user_data['feature_start_time']
+            duration = time_module.monotonic() - context.user_data['feature_start_time']
             analytics.track_user_engagement(
                 user_id=user_id,
                 feature=prev_feature,
                 engagement_time_msec=int(duration * 1000)
             )
-        context.user_data['feature_start_time'] = time_module.time()
+        context.user_data['feature_start_time'] = time_module.monotonic()
 
 
 # ------------------------------------------------------------------------
 # 4. CallbackQuery Handler
 # ------------------------------------------------------------------------
+async def handle_fav_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str, hall_number: int, code: str) -> None:
+    """Toggle a publisher in the user's favorites (fav_<hall>_<code>)."""
+    query = update.callback_query
+    try:
+        logger.info(f"Processing favorite toggle callback: {query.data}")
+        
+        # Verify publisher exists
+        publisher = hall_manager.get_publisher_by_code(code, hall_number)
+        if not publisher:
+            logger.error(f"Publisher not found - hall: {hall_number}, code: {code}")
+            await send_error(query, ERROR_PUBLISHER_NOT_FOUND)
+            return
+        
+        logger.info(f"Found publisher: {publisher.get('nameAr')} in hall {hall_number}")
+        
+        # Create composite key
+        composite_key = f"{hall_number}_{code}"
+        
+        # Toggle favorite; the result is the new status, so favorites aren't re-read below
+        toggle_result = await toggle_favorite(update, context, composite_key)
+        logger.info(f"Toggle result: {toggle_result}")
+        
+        analytics.track_bookmark_action(
+            user_id=user_id,
+            publisher_code=code,
+            action="add" if toggle_result else "remove"
+        )
+        
+        # Update view
+        await handle_publisher_selection(update, context, publisher, is_callback=True, is_favorite=toggle_result)
+        logger.info("Publisher view updated successfully")
+        
+    except Exception as e:
+        logger.error(f"Error in favorite toggle: {e}", exc_info=True)
+        await send_error(query, "عذراً، حدث خطأ أثناء تحديث المفضلة")
+
+async def handle_search_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str) -> None:
+    """Prompt the user to type a search query."""
+    text = (
+        "*البحث عن ناشر* 🔍\n\n"
+        "اكتب اسم دار النشر أو رقم الجناح"
+    )
+    await safe_edit_message(update.callback_query, text)
+
+MAPS_MENU_TEXT: Final = "*خريطة المعرض* 🗺\n\nاختر القاعة التي تريد عرض خريطتها:"
+
+MAPS_MENU_MARKUP: Final = StaticInlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("قاعة 1", callback_data="hall_1"),
+        InlineKeyboardButton("قاعة 2", callback_data="hall_2")
+    ],
+    [
+        InlineKeyboardButton("قاعة 3", callback_data="hall_3"),
+        InlineKeyboardButton("قاعة 4", callback_data="hall_4")
+    ],
+    [InlineKeyboardButton("قاعة 5", callback_data="hall_5")],
+    [InlineKeyboardButton("عودة للقائمة الرئيسية", callback_data="start")]
+])
+
+async def handle_maps_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str) -> None:
+    """Show the hall selection menu."""
+    await safe_edit_message(update.callback_query, MAPS_MENU_TEXT, MAPS_MENU_MARKUP)
+
+async def handle_pub_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str, hall_number: int, code: str) -> None:
+    """Show a publisher's details (pub_<hall>_<code>)."""
+    query = update.callback_query
+    try:
+        publisher = hall_manager.get_publisher_by_code(code, hall_number)
+        if publisher:
+            # Track publisher view
+            analytics.track_publisher_interaction(
+                user_id=user_id,
+                publisher_code=code,
+                action="view",
+                hall_number=hall_number
+            )
+            await handle_publisher_selection(update, context, publisher, is_callback=True)
+        else:
+            await send_error(query, ERROR_PUBLISHER_NOT_FOUND)
+    except Exception as e:
+        logger.error(f"Error handling publisher selection: {e}", exc_info=True)
+        await send_error(query, ERROR_PUBLISHER_VIEW)
+
+async def handle_loc_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str, hall_number: int, code: str) -> None:
+    """Show a publisher's location on the hall map (loc_<hall>_<code>)."""
+    query = update.callback_query
+    try:
+        # Track map interaction
+        analytics.track_map_interaction(
+            user_id=user_id,
+            hall_number=hall_number,
+            action="view"
+        )
+        await handle_publisher_location(query, hall_number, code)
+    except Exception as e:
+        logger.error(f"Error handling location view: {e}", exc_info=True)
+        await send_error(query, ERROR_LOCATION_VIEW)
+
+async def handle_hall_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str, hall_number: int) -> None:
+    """Show a hall map (hall_<hall>)."""
+    query = update.callback_query
+    try:
+        # Track map interaction
+        analytics.track_map_interaction(
+            user_id=user_id,
+            hall_number=hall_number,
+            action="view"
+        )
+        await handle_hall_map(query, hall_number)
+    except Exception as e:
+        logger.error(f"Error handling hall map: {e}", exc_info=True)
+        await send_error(query, "عذراً، حدث خطأ أثناء عرض خريطة القاعة")
+
+async def handle_section_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str, hall_number: int, section: str) -> None:
+    """Show the publishers in a hall section (section_<hall>_<section>)."""
+    query = update.callback_query
+    try:
+        # Track map interaction
+        analytics.track_map_interaction(
+            user_id=user_id,
+            hall_number=hall_number,
+            action="view"
+        )
+        await handle_section_view(query, hall_number, section)
+    except Exception as e:
+        logger.error(f"Error handling section view: {e}", exc_info=True)
+        await send_error(query, "عذراً، حدث خطأ أثناء عرض القسم")
+
+async def handle_favorites_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str) -> None:
+    """Show the user's favorites."""
+    await show_favorites(update, context)
+
+async def handle_events_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str) -> None:
+    """Show publisher offers."""
+    await handle_events_view(update.callback_query)
+
+async def handle_about_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str) -> None:
+    """Show the about page."""
+    await handle_about_view(update.callback_query)
+
+async def handle_start_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str) -> None:
+    """Return to the home page."""
+    await show_homepage(update, context)
+
+# Callbacks whose data is a fixed action name
+CALLBACK_ACTIONS: Final = {
+    "search": handle_search_callback,
+    "maps": handle_maps_callback,
+    "favorites": handle_favorites_callback,
+    "events": handle_events_callback,
+    "about": handle_about_callback,
+    "start": handle_start_callback,
+}
+
+# Callbacks whose data is "<prefix>_<hall>_<code or section>", keyed by prefix
+CALLBACK_PREFIX_HANDLERS: Final = {
+    "fav": handle_fav_callback,
+    "pub": handle_pub_callback,
+    "loc": handle_loc_callback,
+    "section": handle_section_callback,
+}
+
+# Parses every callback handle_callback can route; PTB matches it once and hands us the match
+CALLBACK_PATTERN: Final = re.compile(
+    r"^(?:(?P<action>{})|(?P<prefix>{})_(?P<hall>\d+)_(?P<arg>.+)|hall_(?P<map_hall>\d+))$".format(
+        "|".join(map(re.escape, CALLBACK_ACTIONS)),
+        "|".join(map(re.escape, CALLBACK_PREFIX_HANDLERS))
+    ),
+    re.DOTALL
+)
+
 @track_performance
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle all callback queries from inline keyboards."""
     query = update.callback_query
     user_id = str(update.effective_user.id)
     
+    # Answer the query concurrently with the real work instead of waiting for it first
+    answer_task = asyncio.create_task(query.answer())
+    
     try:
-        await query.answer()
         logger.info(f"Handling callback for user {user_id}: {query.data}")
         
         # Track feature engagement
         await track_feature_engagement(context, user_id, query.data)
         
-        if query.data.startswith("fav_"):
-            try:
-                logger.info(f"Processing favorite toggle callback: {query.data}")
-                # Validate callback data format
-                parts = query.data.split("_")
-                if len(parts) != 3:
-                    raise ValueError(f"Invalid favorite callback format: {query.data}")
-                
-                _, hall_number, code = parts
-                hall_number = int(hall_number)
-                logger.info(f"Parsed hall_number: {hall_number}, code: {code}")
-                
-                # Verify publisher exists
-                publisher = hall_manager.get_publisher_by_code(code, hall_number)
-                if not publisher:
-                    logger.error(f"Publisher not found - hall: {hall_number}, code: {code}")
-                    await safe_edit_message(
-                        query, 
-                        "عذراً، لم يتم العثور على الناشر",
-                        InlineKeyboardMarkup(create_home_button())
-                    )
-                    return
-                
-                logger.info(f"Found publisher: {publisher.get('nameAr')} in hall {hall_number}")
-                
-                # Create composite key
-                composite_key = f"{hall_number}_{code}"
-                
-                # Check current favorite status
-                is_favorite = composite_key in favorites_manager.get_user_favorites(int(user_id))
-                logger.info(f"Current favorite status: {is_favorite}")
-                
-                # Track analytics before toggle
-                action = "remove" if is_favorite else "add"
-                analytics.track_bookmark_action(
-                    user_id=user_id,
-                    publisher_code=code,
-                    action=action
-                )
-                
-                # Toggle favorite
-                toggle_result = await toggle_favorite(update, context, composite_key)
-                logger.info(f"Toggle result: {toggle_result}")
-                
-                # Update view
-                await handle_publisher_selection(update, context, publisher, is_callback=True)
-                logger.info("Publisher view updated successfully")
-                
-            except ValueError as e:
-                logger.error(f"Invalid data format in favorite toggle: {e}", exc_info=True)
-                await safe_edit_message(
-                    query,
-                    "عذراً، حدث خطأ في تنسيق البيانات",
-                    InlineKeyboardMarkup(create_home_button())
-                )
-            except Exception as e:
-                logger.error(f"Error in favorite toggle: {e}", exc_info=True)
-                await safe_edit_message(
-                    query,
-                    "عذراً، حدث خطأ أثناء تحديث المفضلة",
-                    InlineKeyboardMarkup(create_home_button())
-                )
-        
-        elif query.data == "search":
-            text = (
-                "*البحث عن ناشر* 🔍\n\n"
-                "اكتب اسم دار النشر أو رقم الجناح"
-            )
-            await safe_edit_message(query, text)
-            
-        elif query.data == "maps":
-            text = "*خريطة المعرض* 🗺\n\nاختر القاعة التي تريد عرض خريطتها:"
-            keyboard = []
-            row = []
-            for hall_num in range(1, 6):
-                row.append(InlineKeyboardButton(f"قاعة {hall_num}", callback_data=f"hall_{hall_num}"))
-                if len(row) == 2:
-                    keyboard.append(row)
-                    row = []
-            if row:
-                keyboard.append(row)
-            keyboard.append([InlineKeyboardButton("عودة للقائمة الرئيسية", callback_data="start")])
-            
-            await safe_edit_message(
-                query,
-                text,
-                InlineKeyboardMarkup(keyboard)
+        # Dispatch on the CALLBACK_PATTERN match PTB already made
+        match = context.matches[0]
+        if action := match["action"]:
+            await CALLBACK_ACTIONS[action](update, context, user_id)
+        elif prefix := match["prefix"]:
+            await CALLBACK_PREFIX_HANDLERS[prefix](
+                update, context, user_id, int(match["hall"]), match["arg"]
             )
-            
-        elif query.data.startswith("pub_"):
-            try:
-                _, hall_number, code = query.data.split("_")
-                hall_number = int(hall_number)
-                publisher = hall_manager.get_publisher_by_code(code, hall_number)
-                if publisher:
-                    # Track publisher view
-                    analytics.track_publisher_interaction(
-                        user_id=user_id,
-                        publisher_code=code,
-                        action="view",
-                        hall_number=hall_number
-                    )
-                    await handle_publisher_selection(update, context, publisher, is_callback=True)
-                else:
-                    text = "عذراً، لم يتم العثور على الناشر"
-                    await safe_edit_message(query, text, InlineKeyboardMarkup(create_home_button()))
-            except Exception as e:
-                logger.error(f"Error handling publisher selection: {e}", exc_info=True)
-                await safe_edit_message(
-                    query,
-                    "عذراً، حدث خطأ أثناء عرض معلومات الناشر",
-                    InlineKeyboardMarkup(create_home_button())
-                )
-            
-        elif query.data.startswith("loc_"):
-            try:
-                _, hall_number, code = query.data.split("_")
-                # Track map interaction
-                analytics.track_map_interaction(
-                    user_id=user_id,
-                    hall_number=hall_number,
-                    action="view"
-                )
-                await handle_publisher_location(query, int(hall_number), code)
-            except Exception as e:
-                logger.error(f"Error handling location view: {e}", exc_info=True)
-                await safe_edit_message(
-                    query,
-                    "عذراً، حدث خطأ أثناء عرض موقع الناشر",
-                    InlineKeyboardMarkup(create_home_button())
-                )
-            
-        elif query.data.startswith("hall_"):
-            try:
-                hall_number = int(query.data.split("_")[1])
-                # Track map interaction
-                analytics.track_map_interaction(
-                    user_id=user_id,
-                    hall_number=str(hall_number),
-                    action="view"
-                )
-                await handle_hall_map(query, hall_number)
-            except Exception as e:
-                logger.error(f"Error handling hall map: {e}", exc_info=True)
-                await safe_edit_message(
-                    query,
-                    "عذراً، حدث خطأ أثناء عرض خريطة القاعة",
-                    InlineKeyboardMarkup(create_home_button())
-                )
-            
-        elif query.data.startswith("section_"):
-            try:
-                _, hall_number, section = query.data.split("_")
-                # Track map interaction
-                analytics.track_map_interaction(
-                    user_id=user_id,
-                    hall_number=hall_number,
-                    action="view"
-                )
-                await handle_section_view(query, int(hall_number), section)
-            except Exception as e:
-                logger.error(f"Error handling section view: {e}", exc_info=True)
-                await safe_edit_message(
-                    query,
-                    "عذراً، حدث خطأ أثناء عرض القسم",
-                    InlineKeyboardMarkup(create_home_button())
-                )
-            
-        elif query.data == "favorites":
-            await show_favorites(update, context)
-            
-        elif query.data == "events":
-            await handle_events_view(query)
-            
-        elif query.data == "about":
-            await handle_about_view(query)
-            
-        elif query.data == "start":
-            await show_homepage(update, context)
-            
         else:
-            logger.warning(f"Unhandled callback data: {query.data}")
-            await safe_edit_message(
-                query,
-                "عذراً، حدث خطأ غير متوقع",
-                InlineKeyboardMarkup(create_home_button())
-            )
+            await handle_hall_callback(update, context, user_id, int(match["map_hall"]))
         
     except Exception as e:
         logger.error(f"Unhandled error in callback handler: {e}", exc_info=True)
         try:
-            await safe_edit_message(
-                query,
-                "عذراً، حدث خطأ غير متوقع",
-                InlineKeyboardMarkup(create_home_button())
-            )
-        except:
+            await send_error(query, ERROR_UNEXPECTED)
+        except Exception:
             logger.error("Failed to send error message to user", exc_info=True)
+    finally:
+        try:
+            await answer_task
+        except telegram.error.TelegramError as e:
+            # Usually a stale query; the spinner clears on its own
+            logger.warning(f"Could not answer callback query: {e}")
+
+async def handle_unknown_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Answer buttons no handler recognises (e.g. from an older bot version)."""
+    query = update.callback_query
+    logger.warning(f"Unhandled callback data: {query.data}")
+    try:
+        await query.answer()
+        await send_error(query, ERROR_UNEXPECTED)
+    except Exception:
+        logger.error("Failed to send error message to user", exc_info=True)
 
 @track_performance
 async def toggle_favorite(update: Update, context: ContextTypes.DEFAULT_TYPE, composite_key: str) -> bool:
-    """Add or remove a publisher from favorites."""
+    """
+    Add or remove a publisher from favorites.
+    The caller has already looked up the publisher, so it isn't fetched again here.
+    """
     try:
         user_id = update.effective_user.id
         logger.info(f"Toggling favorite for user {user_id}, composite_key: {composite_key}")
         
-        # Validate composite key format
-        if '_' not in composite_key:
-            logger.error(f"Invalid composite key format: {composite_key}")
-            return False
-            
-        hall_number, code = composite_key.split('_')
-        try:
-            hall_number = int(hall_number)
-        except ValueError:
-            logger.error(f"Invalid hall number in composite key: {composite_key}")
-            return False
-            
-        # Verify publisher exists
-        publisher = hall_manager.get_publisher_by_code(code, hall_number)
-        if not publisher:
-            logger.error(f"Publisher not found for composite key: {composite_key}")
-            return False
-            
-        # Toggle favorite
+        # Toggle favorite (the manager validates the composite key format)
         result = favorites_manager.toggle_favorite(user_id, composite_key)
         logger.info(f"Toggle result for user {user_id}, composite_key {composite_key}: {'added' if result else 'removed'}")
         
-        # Track analytics
-        analytics.track_favorite_action(
-            user_id=user_id,
-            publisher_code=composite_key,
-            action="add" if result else "remove"
-        )
-        
         return result
         
     except Exception as e:
@@ -751,123 +1077,63 @@ async def handle_hall_map(query: telegram.CallbackQuery, hall_number: int) -> No
     """Handle displaying a hall map with sections and navigation."""
     hall_info = map_manager.get_hall_info(hall_number)
     if not hall_info:
-        text = "عذراً، لا يمكن عرض الخريطة حالياً"
-        await safe_edit_message(query, text, InlineKeyboardMarkup(create_home_button()))
-        return
-    
-    publishers = hall_manager.get_hall_publishers(hall_number)
-    svg_path = map_manager.save_hall_map(hall_number, publishers, highlight_code=None)
-    if not svg_path:
-        text = "عذراً، لا يمكن عرض الخريطة حالياً"
-        await safe_edit_message(query, text, InlineKeyboardMarkup(create_home_button()))
+        await send_error(query, ERROR_MAP_UNAVAILABLE)
         return
     
     try:
-        png_path = svg_path.replace(".svg", ".png")
-        cairosvg.svg2png(url=svg_path, write_to=png_path)
-        
-        # Create section buttons
-        keyboard = []
-        row = []
-        for section in hall_info["sections"]:
-            section_pubs = hall_manager.get_section_publishers(hall_number, section)
-            row.append(InlineKeyboardButton(
-                f"قسم {section} ({len(section_pubs)})",
-                callback_data=f"section_{hall_number}_{section}"
-            ))
-            if len(row) == 2:
-                keyboard.append(row)
-                row = []
-        if row:
-            keyboard.append(row)
-        
-        # Add navigation buttons
-        nav_row = create_nav_buttons(hall_number, 5)
-        if nav_row:
-            keyboard.append(nav_row)
-        
-        # Add home buttons
-        keyboard.append([
-            InlineKeyboardButton("عودة لقائمة القاعات", callback_data="maps"),
-            InlineKeyboardButton("القائمة الرئيسية", callback_data="start")
-        ])
-        
         caption = (
             f"*خريطة {hall_info['name']}* 🗺\n"
-            f"عدد الناشرين: {len(publishers)}"
+            f"عدد الناشرين: {hall_manager.hall_counts.get(hall_number, 0)}"
         )
         
-        await safe_delete_message(query.message)
-        
-        with open(png_path, "rb") as photo:
-            await query.message.reply_photo(
-                photo=photo,
-                caption=caption,
-                parse_mode=ParseMode.MARKDOWN,
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-        
-        # Cleanup temporary files
-        os.remove(svg_path)
-        os.remove(png_path)
+        sent = await send_photo_cached(
+            f"hall_{hall_number}",
+            lambda photo: safe_edit_photo(query, photo, caption, hall_map_markup(hall_number)),
+            partial(render_hall_png_async, hall_number)
+        )
+        if sent is None:
+            await send_error(query, ERROR_MAP_UNAVAILABLE)
         
     except Exception as e:
         logger.error(f"Error generating map: {e}")
-        text = "عذراً، لا يمكن عرض الخريطة حالياً"
-        await safe_edit_message(query, text, InlineKeyboardMarkup(create_home_button()))
+        await send_error(query, ERROR_MAP_UNAVAILABLE)
+
+@lru_cache(maxsize=16)
+def section_view_markup(hall_number: int) -> InlineKeyboardMarkup:
+    """Build the section list's keyboard (back to the hall map, home); static per hall."""
+    return StaticInlineKeyboardMarkup([
+        [
+            InlineKeyboardButton(
+                f"عودة لخريطة قاعة {hall_number}",
+                callback_data=f"hall_{hall_number}"
+            ),
+            InlineKeyboardButton("القائمة الرئيسية", callback_data="start")
+        ]
+    ])
 
 async def handle_section_view(query: telegram.CallbackQuery, hall_number: int, section: str) -> None:
     """Handle displaying publishers in a specific section."""
     publishers = hall_manager.get_section_publishers(hall_number, section)
     if publishers:
-        text = f"*ناشرو قسم {section} - قاعة {hall_number}* 📍\n\n"
+        parts = [f"*ناشرو قسم {section} - قاعة {hall_number}* 📍\n\n"]
         for pub in publishers:
-            text += f"• *{pub['nameAr']}*\n"
-            text += f"  🏷 الكود: `{pub['code']}`\n\n"
+            parts.append(f"• *{pub['nameAr']}*\n  🏷 الكود: `{pub['code']}`\n\n")
+        text = "".join(parts)
     else:
         text = (
             f"*قسم {section} - قاعة {hall_number}* 📍\n\n"
             "لا يوجد ناشرين في هذا القسم حالياً"
         )
     
-    keyboard = [
-        [
-            InlineKeyboardButton(
-                f"عودة لخريطة قاعة {hall_number}",
-                callback_data=f"hall_{hall_number}"
-            ),
-            InlineKeyboardButton("القائمة الرئيسية", callback_data="start")
-        ]
-    ]
-    
-    await safe_delete_message(query.message)
-    await query.message.reply_text(
+    await replace_message(query.message, query.message.reply_text(
         text,
         parse_mode=ParseMode.MARKDOWN,
-        reply_markup=InlineKeyboardMarkup(keyboard)
-    )
-
-async def handle_categories_view(query: telegram.CallbackQuery) -> None:
-    """Handle displaying publisher categories."""
-    categories = {}
-    for hall_publishers in hall_manager.halls.values():
-        for pub in hall_publishers:
-            if pub_categories := pub.get('categories', []):
-                for category in pub_categories:
-                    categories[category] = categories.get(category, 0) + 1
-    
-    if categories:
-        text = "*تصنيفات دور النشر* 📚\n\n"
-        sorted_categories = sorted(categories.items(), key=lambda x: (-x[1], x[0]))
-        for cat, count in sorted_categories:
-            text += f"• {cat}: {count} ناشر\n"
-    else:
-        text = "*تصنيفات دور النشر* 📚\n\nلم يتم إضافة تصنيفات بعد"
-    
-    await safe_edit_message(query, text, InlineKeyboardMarkup(create_home_button()))
+        reply_markup=section_view_markup(hall_number)
+    ))
 
-async def handle_events_view(query: telegram.CallbackQuery) -> None:
-    """Handle displaying publisher events and offers."""
+@lru_cache(maxsize=None)
+def events_text() -> str:
+    """Build the offers page from the (static) hall data."""
     all_offers = []
     for hall_publishers in hall_manager.halls.values():
         for pub in hall_publishers:
@@ -876,23 +1142,27 @@ async def handle_events_view(query: telegram.CallbackQuery) -> None:
                     all_offers.append(f"• {offer} ({pub.get('nameAr', 'بدون اسم')})")
     
     if all_offers:
-        text = "*عروض دور النشر* 💥\n\n" + "\n".join(all_offers)
-    else:
-        text = "*عروض دور النشر* 💥\n\nلم يتم إضافة عروض بعد"
-    
-    await safe_edit_message(query, text, InlineKeyboardMarkup(create_home_button()))
+        return "*عروض دور النشر* 💥\n\n" + "\n".join(all_offers)
+    return "*عروض دور النشر* 💥\n\nلم يتم إضافة عروض بعد"
 
-async def handle_about_view(query: telegram.CallbackQuery) -> None:
-    """Handle displaying about information."""
-    total_publishers = sum(len(pubs) for pubs in hall_manager.halls.values())
-    text = (
+async def handle_events_view(query: telegram.CallbackQuery) -> None:
+    """Handle displaying publisher events and offers."""
+    await safe_edit_message(query, events_text(), HOME_MARKUP)
+
+@lru_cache(maxsize=None)
+def about_text() -> str:
+    """Build the about page (it includes the publisher total from the hall data)."""
+    return (
         "*معرض القاهرة الدولي للكتاب ٢٠٢٥* ℹ️\n\n"
         "أكبر وأقدم معرض كتاب في العالم العربي\n\n"
-        f"• عدد دور النشر: {total_publishers}\n"
+        f"• عدد دور النشر: {TOTAL_PUBLISHERS}\n"
         "• عدد القاعات: 5\n"
         "• الموقع: مركز مصر للمعارض الدولية"
     )
-    await safe_edit_message(query, text, InlineKeyboardMarkup(create_home_button()))
+
+async def handle_about_view(query: telegram.CallbackQuery) -> None:
+    """Handle displaying about information."""
+    await safe_edit_message(query, about_text(), HOME_MARKUP)
 
 async def handle_publisher_location(query: telegram.CallbackQuery, hall_number: int, code: str) -> None:
     """Handle displaying a publisher's location on the hall map."""
@@ -903,22 +1173,10 @@ async def handle_publisher_location(query: telegram.CallbackQuery, hall_number:
         
         if not hall_info or not publisher:
             logger.error(f"Hall info or publisher not found - hall: {hall_number}, code: {code}")
-            text = "عذراً، لا يمكن عرض الموقع حالياً"
-            await safe_edit_message(query, text, InlineKeyboardMarkup(create_home_button()))
-            return
-        
-        publishers = hall_manager.get_hall_publishers(hall_number)
-        svg_path = map_manager.save_hall_map(hall_number, publishers, highlight_code=code)
-        if not svg_path:
-            logger.error("Failed to generate map")
-            text = "عذراً، لا يمكن عرض الموقع حالياً"
-            await safe_edit_message(query, text, InlineKeyboardMarkup(create_home_button()))
+            await send_error(query, ERROR_LOCATION_UNAVAILABLE)
             return
         
         try:
-            png_path = svg_path.replace(".svg", ".png")
-            cairosvg.svg2png(url=svg_path, write_to=png_path)
-            
             keyboard = [
                 [
                     InlineKeyboardButton("↩️ عودة للناشر", callback_data=f"pub_{hall_number}_{code}"),
@@ -931,29 +1189,22 @@ async def handle_publisher_location(query: telegram.CallbackQuery, hall_number:
                 f"الكود: `{code}` - قاعة {hall_number}"
             )
             
-            await safe_delete_message(query.message)
-            
-            with open(png_path, "rb") as photo:
-                await query.message.reply_photo(
-                    photo=photo,
-                    caption=caption,
-                    parse_mode=ParseMode.MARKDOWN,
-                    reply_markup=InlineKeyboardMarkup(keyboard)
-                )
-            
-            # Cleanup temporary files
-            os.remove(svg_path)
-            os.remove(png_path)
+            sent = await send_photo_cached(
+                f"loc_{hall_number}_{code}",
+                lambda photo: safe_edit_photo(query, photo, caption, InlineKeyboardMarkup(keyboard)),
+                partial(render_hall_png_async, hall_number, code)
+            )
+            if sent is None:
+                logger.error("Failed to generate map")
+                await send_error(query, ERROR_LOCATION_UNAVAILABLE)
             
         except Exception as e:
             logger.error(f"Error generating publisher map: {e}", exc_info=True)
-            text = "عذراً، لا يمكن عرض الموقع حالياً"
-            await safe_edit_message(query, text, InlineKeyboardMarkup(create_home_button()))
+            await send_error(query, ERROR_LOCATION_UNAVAILABLE)
             
     except Exception as e:
         logger.error(f"Error in handle_publisher_location: {e}", exc_info=True)
-        text = "عذراً، حدث خطأ أثناء عرض موقع الناشر"
-        await safe_edit_message(query, text, InlineKeyboardMarkup(create_home_button()))
+        await send_error(query, ERROR_LOCATION_VIEW)
 
 async def show_favorites(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Show user's favorite publishers."""
@@ -970,26 +1221,25 @@ async def show_favorites(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         logger.info(f"Retrieved favorites for user {user_id}: {favorites}")
         
         if not favorites:
-            keyboard = [[InlineKeyboardButton("عودة للقائمة الرئيسية", callback_data="start")]]
             await safe_edit_message(
                 query,
                 "لا توجد لديك دور نشر في المفضلة بعد.\n"
                 "يمكنك إضافة دور النشر للمفضلة عند البحث عنها! ⭐️",
-                InlineKeyboardMarkup(keyboard)
+                HOME_MARKUP
             )
             return
 
-        text = "*المفضلة* ⭐️\n\n"
+        lines = ["*المفضلة* ⭐️\n\n"]
         keyboard = []
         
         for composite_key in favorites:
             try:
-                # Validate composite key format
-                if '_' not in composite_key:
+                # Validate composite key format (codes may themselves contain '_')
+                hall_number, sep, code = composite_key.partition('_')
+                if not sep:
                     logger.warning(f"Invalid favorite format found: {composite_key}")
                     continue
                     
-                hall_number, code = composite_key.split('_')
                 try:
                     hall_number = int(hall_number)
                 except ValueError:
@@ -1003,7 +1253,7 @@ async def show_favorites(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     continue
                 
                 # Add to display
-                text += f"• {publisher['nameAr']} ({code} - قاعة {hall_number})\n"
+                lines.append(f"• {publisher['nameAr']} ({code} - قاعة {hall_number})\n")
                 keyboard.append([
                     InlineKeyboardButton(
                         f"📍 {publisher['nameAr']}",
@@ -1019,19 +1269,15 @@ async def show_favorites(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         await safe_edit_message(
             query,
-            text,
+            "".join(lines),
             InlineKeyboardMarkup(keyboard)
         )
         
     except Exception as e:
         logger.error(f"Error showing favorites: {e}", exc_info=True)
         try:
-            await safe_edit_message(
-                query,
-                "عذراً، حدث خطأ أثناء عرض المفضلة",
-                InlineKeyboardMarkup(create_home_button())
-            )
-        except:
+            await send_error(query, "عذراً، حدث خطأ أثناء عرض المفضلة")
+        except Exception:
             logger.error("Failed to send error message to user", exc_info=True)
 
 
@@ -1040,12 +1286,31 @@ async def show_favorites(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 # ------------------------------------------------------------------------
 REPORT_DESCRIPTION, REPORT_EMAIL = range(2)
 
+# The bug report keyboards never change, so build them once
+REPORT_CANCEL_MARKUP: Final = StaticInlineKeyboardMarkup([
+    [InlineKeyboardButton("❌ إلغاء", callback_data="cancel_bug_report")]
+])
+REPORT_EMAIL_MARKUP: Final = StaticInlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("❌ إلغاء", callback_data="cancel_bug_report"),
+        InlineKeyboardButton("↩️ رجوع", callback_data="report_bug")
+    ]
+])
+REPORT_RETRY_MARKUP: Final = StaticInlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("🔄 إعادة المحاولة", callback_data="report_bug"),
+        InlineKeyboardButton("📋 القائمة الرئيسية", callback_data="start")
+    ]
+])
+MAIN_MENU_MARKUP: Final = StaticInlineKeyboardMarkup([
+    [InlineKeyboardButton("📋 القائمة الرئيسية", callback_data="start")]
+])
+
 async def start_bug_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Start the bug report process."""
     query = update.callback_query
     await query.answer()
     
-    keyboard = [[InlineKeyboardButton("❌ إلغاء", callback_data="cancel_bug_report")]]
     message_text = (
         "🐛 شكراً لمساعدتنا في تحسين البوت!\n\n"
         "الرجاء وصف المشكلة التي واجهتك بالتفصيل. قد تحصل على كوبون خصم أو عرض خاص على بعض الإصدارات المتاحة في منصة أسفار! 🎁"
@@ -1053,7 +1318,7 @@ async def start_bug_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     
     await query.message.reply_text(
         text=message_text,
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=REPORT_CANCEL_MARKUP
     )
     return REPORT_DESCRIPTION
 
@@ -1061,13 +1326,6 @@ async def get_bug_description(update: Update, context: ContextTypes.DEFAULT_TYPE
     """Store the bug description and ask for email."""
     context.user_data['bug_description'] = update.message.text
     
-    keyboard = [
-        [
-            InlineKeyboardButton("❌ إلغاء", callback_data="cancel_bug_report"),
-            InlineKeyboardButton("↩️ رجوع", callback_data="report_bug")
-        ]
-    ]
-    
     message_text = (
         "شكراً على الوصف!\n\n"
         "الرجاء إدخال بريدك الإلكتروني للتواصل معك إذا احتجنا لمزيد من المعلومات، أو إرسال الكوبون أو العرض الخاص بك."
@@ -1075,15 +1333,45 @@ async def get_bug_description(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     await update.message.reply_text(
         text=message_text,
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=REPORT_EMAIL_MARKUP
     )
     return REPORT_EMAIL
 
-# Add email validation function
+EMAIL_RE: Final = re.compile(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}")
+
 def is_valid_email(email: str) -> bool:
     """Validate email address format."""
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, email))
+    return EMAIL_RE.fullmatch(email) is not None
+
+BUG_REPORT_FROM: Final = os.getenv('EMAIL_FROM', 'bot@asfar.io')
+BUG_REPORT_TO: Final = 'welcome@asfar.io'
+CAIRO_TZ: Final = pytz.timezone('Africa/Cairo')
+
+# One authenticated SMTP session is reused across bug reports, so each report
+# skips the TCP + STARTTLS + AUTH round trips unless the server dropped it
+smtp_connection: smtplib.SMTP | None = None
+smtp_lock = threading.Lock()
+
+def connect_smtp() -> smtplib.SMTP:
+    """Open and authenticate a new SMTP session."""
+    server = smtplib.SMTP(os.getenv('SMTP_SERVER', 'smtp.gmail.com'), 587, timeout=30)
+    server.starttls()
+    server.login(os.getenv('EMAIL_USER'), os.getenv('EMAIL_APP_PASSWORD'))
+    return server
+
+def send_email(msg: EmailMessage) -> None:
+    """Send an email over SMTP (blocking; call it from a worker thread)."""
+    global smtp_connection
+    with smtp_lock:
+        if smtp_connection is not None:
+            try:
+                smtp_connection.send_message(msg)
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # Servers close idle sessions; reconnect and send again below
+                smtp_connection = None
+        smtp_connection = connect_smtp()
+        smtp_connection.send_message(msg)
 
 async def submit_bug_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle the submitted email and send the bug report."""
@@ -1091,18 +1379,12 @@ async def submit_bug_report(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # Validate email format
     if not is_valid_email(email):
-        keyboard = [
-            [
-                InlineKeyboardButton("❌ إلغاء", callback_data="cancel_bug_report"),
-                InlineKeyboardButton("↩️ رجوع", callback_data="report_bug")
-            ]
-        ]
         message_text = (
             " .عذراً، البريد الإلكتروني غير صحيح. أرجو التحقق ثم إعادة المحاولة\n\n"
         )
         await update.message.reply_text(
             text=message_text,
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=REPORT_EMAIL_MARKUP
         )
         return REPORT_EMAIL
     
@@ -1110,9 +1392,9 @@ async def submit_bug_report(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user = update.effective_user
     
     # Prepare email content
-    msg = MIMEMultipart()
-    msg['From'] = os.getenv('EMAIL_FROM', 'bot@asfar.io')
-    msg['To'] = 'welcome@asfar.io'
+    msg = EmailMessage()
+    msg['From'] = BUG_REPORT_FROM
+    msg['To'] = BUG_REPORT_TO
     msg['Subject'] = f'Bug Report from Book Fair Bot User {user.id}'
     
     body = f"""
@@ -1125,17 +1407,14 @@ async def submit_bug_report(update: Update, context: ContextTypes.DEFAULT_TYPE)
     Description:
     {description}
     
-    Time: {datetime.now(pytz.timezone('Africa/Cairo')).strftime('%Y-%m-%d %H:%M:%S')}
+    Time: {datetime.now(CAIRO_TZ).strftime('%Y-%m-%d %H:%M:%S')}
     """
     
-    msg.attach(MIMEText(body, 'plain'))
+    msg.set_content(body)
     
     # Send email
     try:
-        with smtplib.SMTP(os.getenv('SMTP_SERVER', 'smtp.gmail.com'), 587) as server:
-            server.starttls()
-            server.login(os.getenv('EMAIL_USER'), os.getenv('EMAIL_APP_PASSWORD'))
-            server.send_message(msg)
+        await asyncio.to_thread(send_email, msg)
         
         # Track successful bug report
         analytics.track_event(
@@ -1147,26 +1426,18 @@ async def submit_bug_report(update: Update, context: ContextTypes.DEFAULT_TYPE)
             }
         )
         
-        keyboard = [[InlineKeyboardButton("📋 القائمة الرئيسية", callback_data="start")]]
-        
         await update.message.reply_text(
             "✅ تم إرسال البلاغ بنجاح!\n\n"
             "شكراً على مساعدتنا في تحسين خدمة البوت. سنراجع البلاغ قريباً.\n"
             "إذا كان البلاغ صحيحاً، سنرسل لك كود خصم خاص على منتجات أسفار! 🎁",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=MAIN_MENU_MARKUP
         )
         
     except Exception as e:
         logger.error(f"Failed to send bug report email: {e}")
-        keyboard = [
-            [
-                InlineKeyboardButton("🔄 إعادة المحاولة", callback_data="report_bug"),
-                InlineKeyboardButton("📋 القائمة الرئيسية", callback_data="start")
-            ]
-        ]
         await update.message.reply_text(
             "عذراً، حدث خطأ أثناء إرسال البلاغ. الرجاء المحاولة مرة أخرى لاحقاً.",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=REPORT_RETRY_MARKUP
         )
     
     return ConversationHandler.END
@@ -1176,11 +1447,9 @@ async def cancel_bug_report(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
     
-    keyboard = [[InlineKeyboardButton("📋 القائمة الرئيسية", callback_data="start")]]
-    
     await query.message.reply_text(
         "تم إلغاء البلاغ.",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=MAIN_MENU_MARKUP
     )
     return ConversationHandler.END
 
@@ -1211,7 +1480,49 @@ bug_report_handler = ConversationHandler(
 # ------------------------------------------------------------------------
 def main() -> None:
     """Start the bot."""
-    application = Application.builder().token(TOKEN).build()
+    log_listener = start_log_listener()
+    init_components()
+    start_render_pool()
+
+    # uvloop's libuv-based event loop is faster for this I/O-bound bot; optional (not on Windows)
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        logger.info("uvloop not installed, using the default asyncio event loop")
+    
+    # Process updates from different users concurrently (PerUserUpdateProcessor keeps
+    # each user's own updates, bug report conversation included, in order); HTTP/2
+    # lets the concurrent replies share one connection to the Bot API
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor(256))
+        .request(OrjsonHTTPXRequest(
+            connection_pool_size=256,
+            http_version="2",
+            read_timeout=20,
+            write_timeout=20,
+            pool_timeout=5
+        ))
+        # getUpdates has its own single-connection pool, so long polls never starve replies
+        .get_updates_request(OrjsonHTTPXRequest(
+            connection_pool_size=1,
+            http_version="2",
+            pool_timeout=30
+        ))
+        # Queue bursts of replies under Telegram's flood limits instead of hitting 429s
+        .rate_limiter(AIORateLimiter(max_retries=3))
+    )
+    if BOT_API_URL:
+        api_url = BOT_API_URL.rstrip('/')
+        builder = (
+            builder
+            .base_url(f"{api_url}/bot")
+            .base_file_url(f"{api_url}/file/bot")
+            .local_mode(True)
+        )
+    application = builder.build()
 
     # Command Handlers
     application.add_handler(CommandHandler("start", start))
@@ -1224,14 +1535,45 @@ def main() -> None:
     # Message Handler (for user text)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 
-    # Callback Query Handler (for inline keyboard buttons)
-    application.add_handler(CallbackQueryHandler(handle_callback))
+    # Callback Query Handlers (for inline keyboard buttons)
+    application.add_handler(CallbackQueryHandler(handle_callback, pattern=CALLBACK_PATTERN))
+    application.add_handler(CallbackQueryHandler(handle_unknown_callback))
     
     # Error Handler
     application.add_error_handler(error_handler)
 
-    print("Starting bot...")
-    application.run_polling()
+    # Pre-render the base hall maps in the render pool while the bot starts up,
+    # so the first map views are served from cache
+    for hall_number in map_manager.halls:
+        if f"hall_{hall_number}" not in photo_file_ids:
+            submit_hall_render(hall_number)
+
+    # Send GA4 events from a background thread instead of inside handlers
+    analytics.start_background_sender()
+
+    # Only text messages and button presses have handlers; don't ask Telegram for anything else
+    allowed_updates = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+    logger.info("Starting bot...")
+    try:
+        if WEBHOOK_URL:
+            application.run_webhook(
+                listen="0.0.0.0",
+                port=int(os.getenv('PORT', '8443')),
+                url_path=TOKEN,
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{TOKEN}",
+                allowed_updates=allowed_updates
+            )
+        else:
+            # Long-poll: each getUpdates waits up to 30s server-side instead of re-polling.
+            # The Updater only queues each batch, so the next getUpdates (acking the
+            # previous offset) is already in flight while the Application handles it
+            application.run_polling(timeout=30, allowed_updates=allowed_updates)
+    finally:
+        analytics.stop_background_sender()
+        favorites_manager.flush()
+        render_pool.shutdown(cancel_futures=True)
+        log_listener.stop()
 
 
 if __name__ == "__main__":
@@ -1,24 +1,32 @@
-import json
 import os
 import logging
-from typing import List, Dict
+import threading
+import orjson
+from typing import List, Dict, Optional
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
 class FavoritesManager:
+    # Seconds to wait after a change before writing, so rapid toggles share one write
+    SAVE_DELAY = 2.0
+    
     def __init__(self):
         self.favorites_file = "data/favorites.json"
         logger.info(f"Initializing FavoritesManager with file: {self.favorites_file}")
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._save_timer: Optional[threading.Timer] = None
         self._ensure_data_dir()
-        self._load_favorites()
+        # Favorites are served from memory; the file is only written behind changes
+        self._favorites: Dict[str, List[str]] = self._load_favorites()
 
     def _validate_composite_key(self, composite_key: str) -> bool:
         """Validate the format of a composite key (hall_number_code)."""
         try:
             if not composite_key or '_' not in composite_key:
                 return False
-            hall_number, code = composite_key.split('_')
+            hall_number, _, code = composite_key.partition('_')
             hall_number = int(hall_number)
             return 1 <= hall_number <= 5 and code.strip()
         except (ValueError, AttributeError):
@@ -31,8 +39,8 @@ class FavoritesManager:
             Path("data").mkdir(exist_ok=True)
             if not os.path.exists(self.favorites_file):
                 logger.info(f"Creating new favorites file: {self.favorites_file}")
-                with open(self.favorites_file, "w") as f:
-                    json.dump({}, f)
+                with open(self.favorites_file, "wb") as f:
+                    f.write(orjson.dumps({}))
             logger.info("Data directory and file check completed")
         except Exception as e:
             logger.error(f"Error ensuring data directory: {e}", exc_info=True)
@@ -42,15 +50,15 @@ class FavoritesManager:
         """Load favorites from file."""
         try:
             logger.info(f"Loading favorites from {self.favorites_file}")
-            with open(self.favorites_file, "r") as f:
-                data = json.load(f)
+            with open(self.favorites_file, "rb") as f:
+                data = orjson.loads(f.read())
                 logger.info(f"Loaded favorites for {len(data)} users")
                 return data
         except FileNotFoundError:
             logger.warning("Favorites file not found, creating new one")
             self._ensure_data_dir()
             return {}
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             logger.error("Corrupted favorites file, creating backup and new file")
             if os.path.exists(self.favorites_file):
                 os.rename(self.favorites_file, f"{self.favorites_file}.bak")
@@ -63,27 +71,53 @@ class FavoritesManager:
         """Save favorites to file."""
         try:
             logger.info(f"Saving favorites to {self.favorites_file}")
-            # Create backup before saving
-            if os.path.exists(self.favorites_file):
-                os.replace(self.favorites_file, f"{self.favorites_file}.bak")
-            with open(self.favorites_file, "w") as f:
-                json.dump(favorites, f)
+            # Write a temp file and swap it in, so a crash mid-write never
+            # leaves a truncated favorites file behind
+            tmp_file = f"{self.favorites_file}.tmp"
+            with open(tmp_file, "wb") as f:
+                f.write(orjson.dumps(favorites))
+            os.replace(tmp_file, self.favorites_file)
             logger.info("Favorites saved successfully")
         except Exception as e:
             logger.error(f"Error saving favorites: {e}", exc_info=True)
-            # Try to restore from backup
-            try:
-                if os.path.exists(f"{self.favorites_file}.bak"):
-                    os.replace(f"{self.favorites_file}.bak", self.favorites_file)
-            except Exception as restore_error:
-                logger.error(f"Failed to restore favorites from backup: {restore_error}", exc_info=True)
             raise
 
+    def _schedule_save(self) -> None:
+        """Write favorites to disk after SAVE_DELAY, coalescing changes made meanwhile."""
+        with self._lock:
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(self.SAVE_DELAY, self.flush)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def flush(self) -> None:
+        """Write any pending favorites changes to disk now.
+
+        Waits for a write already in flight (e.g. from the save timer) before
+        returning, so a flush at shutdown never exits mid-write.
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._save_timer is None:
+                    return
+                self._save_timer.cancel()
+                self._save_timer = None
+            # dict() and list() copies are atomic under the GIL, so handlers can keep
+            # changing favorites while this thread snapshots them
+            snapshot = {user_id: list(favs) for user_id, favs in dict(self._favorites).items()}
+            try:
+                self._save_favorites(snapshot)
+                return
+            except Exception:
+                # Already logged by _save_favorites; try again later
+                pass
+        self._schedule_save()
+
     def get_user_favorites(self, user_id: int) -> List[str]:
         """Get favorites for a specific user."""
         try:
             logger.info(f"Getting favorites for user {user_id}")
-            favorites = self._load_favorites()
+            favorites = self._favorites
             user_favs = favorites.get(str(user_id), [])
             
             # Filter out invalid entries and remove duplicates
@@ -98,7 +132,7 @@ class FavoritesManager:
             if len(valid_favs) != len(user_favs):
                 logger.warning(f"Removed {len(user_favs) - len(valid_favs)} invalid/duplicate favorites for user {user_id}")
                 favorites[str(user_id)] = valid_favs
-                self._save_favorites(favorites)
+                self._schedule_save()
                 
             logger.info(f"Found {len(valid_favs)} valid favorites for user {user_id}")
             return valid_favs
@@ -111,7 +145,7 @@ class FavoritesManager:
         """Add a publisher to user's favorites."""
         try:
             logger.info(f"Adding favorite {publisher_code} for user {user_id}")
-            favorites = self._load_favorites()
+            favorites = self._favorites
             user_id_str = str(user_id)
             
             if user_id_str not in favorites:
@@ -120,7 +154,7 @@ class FavoritesManager:
             
             if publisher_code not in favorites[user_id_str]:
                 favorites[user_id_str].append(publisher_code)
-                self._save_favorites(favorites)
+                self._schedule_save()
                 logger.info(f"Added {publisher_code} to favorites for user {user_id}")
                 return True
             logger.info(f"Publisher {publisher_code} already in favorites for user {user_id}")
@@ -133,12 +167,12 @@ class FavoritesManager:
         """Remove a publisher from user's favorites."""
         try:
             logger.info(f"Removing favorite {publisher_code} for user {user_id}")
-            favorites = self._load_favorites()
+            favorites = self._favorites
             user_id_str = str(user_id)
             
             if user_id_str in favorites and publisher_code in favorites[user_id_str]:
                 favorites[user_id_str].remove(publisher_code)
-                self._save_favorites(favorites)
+                self._schedule_save()
                 logger.info(f"Removed {publisher_code} from favorites for user {user_id}")
                 return True
             logger.info(f"Publisher {publisher_code} not found in favorites for user {user_id}")
@@ -157,7 +191,7 @@ class FavoritesManager:
                 logger.error(f"Invalid composite key format: {composite_key}")
                 return False
             
-            favorites = self._load_favorites()
+            favorites = self._favorites
             user_id_str = str(user_id)
             
             if user_id_str not in favorites:
@@ -169,12 +203,12 @@ class FavoritesManager:
             
             if composite_key in favorites[user_id_str]:
                 favorites[user_id_str].remove(composite_key)
-                self._save_favorites(favorites)
+                self._schedule_save()
                 logger.info(f"Removed {composite_key} from favorites for user {user_id}")
                 return False
             else:
                 favorites[user_id_str].append(composite_key)
-                self._save_favorites(favorites)
+                self._schedule_save()
                 logger.info(f"Added {composite_key} to favorites for user {user_id}")
                 return True
         except Exception as e:
@@ -185,10 +219,10 @@ class FavoritesManager:
         """Set the complete list of favorites for a user."""
         try:
             logger.info(f"Setting favorites for user {user_id}: {favorites_list}")
-            favorites = self._load_favorites()
+            favorites = self._favorites
             user_id_str = str(user_id)
             favorites[user_id_str] = favorites_list
-            self._save_favorites(favorites)
+            self._schedule_save()
             logger.info(f"Successfully set favorites for user {user_id}")
             return True
         except Exception as e:
@@ -199,7 +233,7 @@ class FavoritesManager:
         """Clean up favorites data by removing invalid entries and migrating old format."""
         try:
             logger.info(f"Cleaning favorites for user {user_id}")
-            favorites = self._load_favorites()
+            favorites = self._favorites
             user_id_str = str(user_id)
             
             if user_id_str not in favorites:
@@ -227,7 +261,7 @@ class FavoritesManager:
                         logger.warning(f"Invalid favorite format: {fav}")
                         continue
                         
-                    hall_number, code = fav.split('_')
+                    hall_number, _, code = fav.partition('_')
                     hall_number = int(hall_number)
                     
                     # Verify publisher exists
@@ -246,7 +280,7 @@ class FavoritesManager:
             if valid_favorites_list != user_favs:
                 logger.info(f"Updating favorites for user {user_id}: {valid_favorites_list}")
                 favorites[user_id_str] = valid_favorites_list
-                self._save_favorites(favorites)
+                self._schedule_save()
                 
         except Exception as e:
             logger.error(f"Error cleaning favorites: {e}", exc_info=True) 
\ No newline at end of file
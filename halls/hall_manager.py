@@ -1,5 +1,6 @@
+import hashlib
 import json
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 import os
 import logging
 
@@ -10,9 +11,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Strips Arabic diacritics and folds hamza/madda alef forms into a bare alef,
+# so "إصدارات" and "اصدارات" match each other
+_SEARCH_NORMALIZE_TABLE = str.maketrans(
+    "إأآ",
+    "ااا",
+    "\u064B\u064C\u064D\u064E\u064F\u0650\u0651\u0652\u0670"
+)
+
+def normalize_search_text(text: str) -> str:
+    """Lowercase text and normalize its Arabic letters for search matching."""
+    return text.lower().translate(_SEARCH_NORMALIZE_TABLE)
+
 class HallManager:
     def __init__(self):
         self.halls: Dict[int, List[Dict]] = {}
+        self.hall_counts: Dict[int, int] = {}
+        self._publishers_by_code: Dict[Tuple[int, str], Dict] = {}
+        self._first_publisher_by_code: Dict[str, Dict] = {}
+        self._publishers_by_section: Dict[Tuple[int, str], List[Dict]] = {}
+        self._search_entries: List[Tuple[Dict, Tuple[str, ...]]] = []
+        self._trigram_index: Dict[str, Set[int]] = {}
+        # Length of the longest normalized code or name; longer queries can't match
+        self.max_search_length: int = 0
+        self._adjacent_publishers: Dict[Tuple[int, str, str], List[Dict]] = {}
+        # Hash of the hall files, so caches derived from them can tell when they're stale
+        self.data_version: str = ""
         self.load_halls()
         
     def load_halls(self) -> None:
@@ -22,12 +46,15 @@ class HallManager:
             logger.error(f"Halls directory '{halls_dir}' not found!")
             return
             
+        file_digests = {}
         for filename in os.listdir(halls_dir):
             if filename.startswith("hall") and filename.endswith(".json"):
                 try:
                     hall_number = int(filename[4:-5])  # Extract number from "hallX.json"
-                    with open(os.path.join(halls_dir, filename), 'r', encoding='utf-8') as f:
-                        hall_data = json.load(f)
+                    with open(os.path.join(halls_dir, filename), 'rb') as f:
+                        raw = f.read()
+                        file_digests[filename] = hashlib.sha1(raw).hexdigest()
+                        hall_data = json.loads(raw)
                         if "publishers" in hall_data:
                             self.halls[hall_number] = hall_data["publishers"]
                             logger.info(f"Loaded {len(hall_data['publishers'])} publishers from {filename}")
@@ -36,9 +63,55 @@ class HallManager:
                 except Exception as e:
                     logger.error(f"Error loading {filename}: {e}")
         
+        self.data_version = hashlib.sha1(
+            "".join(file_digests[name] for name in sorted(file_digests)).encode()
+        ).hexdigest()
         logger.info(f"Total halls loaded: {len(self.halls)}")
         for hall_num, publishers in self.halls.items():
             logger.info(f"Hall {hall_num}: {len(publishers)} publishers")
+        
+        self._build_indexes()
+    
+    def _build_indexes(self) -> None:
+        """
+        Index publishers by (hall, code) and (hall, section) in a single pass,
+        plus a trigram index over their normalized code and names for search
+        and each publisher's adjacent booths.
+        """
+        self._publishers_by_code = {}
+        self._first_publisher_by_code = {}
+        self._publishers_by_section = {}
+        self._search_entries = []
+        self._trigram_index = {}
+        for hall_number, publishers in self.halls.items():
+            for pub in publishers:
+                code = pub['code'].lower()
+                self._publishers_by_code.setdefault((hall_number, code), pub)
+                self._first_publisher_by_code.setdefault(code, pub)
+                section = pub.get('section', '').lower()
+                self._publishers_by_section.setdefault((hall_number, section), []).append(pub)
+                
+                entry_id = len(self._search_entries)
+                fields = tuple(normalize_search_text(str(pub.get(key) or '')) for key in ('code', 'nameAr', 'nameEn'))
+                self._search_entries.append((pub, fields))
+                for field in fields:
+                    for i in range(len(field) - 2):
+                        self._trigram_index.setdefault(field[i:i + 3], set()).add(entry_id)
+        
+        self.max_search_length = max(
+            (len(field) for _, fields in self._search_entries for field in fields),
+            default=0
+        )
+        self.hall_counts = {hall_number: len(pubs) for hall_number, pubs in self.halls.items()}
+        
+        # Up to 2 publishers before and after each one in its section's order
+        self._adjacent_publishers = {}
+        for (hall_number, section), section_pubs in self._publishers_by_section.items():
+            for i, pub in enumerate(section_pubs):
+                self._adjacent_publishers.setdefault(
+                    (hall_number, section, pub['code'].lower()),
+                    section_pubs[max(0, i - 2):i] + section_pubs[i + 1:i + 3]
+                )
     
     def get_hall_publishers(self, hall_number: int) -> List[Dict]:
         """Get all publishers in a specific hall."""
@@ -46,71 +119,54 @@ class HallManager:
     
     def get_section_publishers(self, hall_number: int, section: str) -> List[Dict]:
         """Get all publishers in a specific section of a hall."""
-        publishers = self.get_hall_publishers(hall_number)
-        return [pub for pub in publishers if pub.get('section', '').lower() == section.lower()]
+        return self._publishers_by_section.get((hall_number, section.lower()), [])
     
     def get_publisher_by_code(self, code: str, hall_number: int = None) -> Dict:
         """Get a publisher by their code and optionally hall number."""
         if hall_number is not None:
             # Look in specific hall
-            publishers = self.get_hall_publishers(hall_number)
-            for pub in publishers:
-                if pub['code'].lower() == code.lower():
-                    return pub
-            return None
+            return self._publishers_by_code.get((hall_number, code.lower()))
         else:
             # Look in all halls (legacy support)
-            for hall_publishers in self.halls.values():
-                for pub in hall_publishers:
-                    if pub['code'].lower() == code.lower():
-                        return pub
-            return None
+            return self._first_publisher_by_code.get(code.lower())
+    
+    def get_publishers_by_code(self, code: str) -> List[Dict]:
+        """Get every publisher with exactly this code, across all halls."""
+        code = code.lower()
+        return [
+            pub for hall_number in sorted(self.halls)
+            if (pub := self._publishers_by_code.get((hall_number, code)))
+        ]
     
     def search_publishers(self, query: str) -> List[Dict]:
         """Search for publishers by name or code."""
         if not query:
             return []
         
-        results = []
-        query = query.lower().strip()
+        query = normalize_search_text(query).strip()
         logger.info(f"Searching for: {query}")
         
-        # Check if searching for a specific hall
-        hall_match = None
+        # A hall number (e.g. "قاعة 1") lists every publisher in that hall
         hall_query = query.replace('قاعة ', '').replace('hall ', '')
         if hall_query.isdigit():
-            hall_match = int(hall_query)
+            results = list(self.get_hall_publishers(int(hall_query)))
+            logger.info(f"Found {len(results)} results")
+            return results
+        
+        # Only publishers sharing every trigram of the query can contain it;
+        # shorter queries are checked against every publisher
+        if len(query) >= 3:
+            postings = sorted(
+                (self._trigram_index.get(query[i:i + 3], set()) for i in range(len(query) - 2)),
+                key=len
+            )
+            candidates = sorted(set.intersection(*postings)) if postings[0] else []
+            entries = [self._search_entries[i] for i in candidates]
+        else:
+            entries = self._search_entries
         
-        # Search in all halls (or specific hall if specified)
-        for hall_number, hall_publishers in self.halls.items():
-            # Skip if searching for specific hall and this isn't it
-            if hall_match is not None and hall_number != hall_match:
-                continue
-            
-            for pub in hall_publishers:
-                matched = False
-                
-                # Check code (case-insensitive)
-                pub_code = str(pub.get('code', '')).lower()
-                if pub_code and query in pub_code:
-                    logger.info(f"Found by code: {pub.get('nameAr')} ({pub_code}) in Hall {hall_number}")
-                    matched = True
-                
-                # Check Arabic name
-                name_ar = str(pub.get('nameAr', '')).lower()
-                if not matched and name_ar and query in name_ar:
-                    logger.info(f"Found by Arabic name: {pub.get('nameAr')} in Hall {hall_number}")
-                    matched = True
-                
-                # Check English name
-                name_en = str(pub.get('nameEn', '')).lower()
-                if not matched and name_en and query in name_en:
-                    logger.info(f"Found by English name: {pub.get('nameEn')} in Hall {hall_number}")
-                    matched = True
-                
-                # Add to results if matched
-                if matched or hall_match == hall_number:
-                    results.append(pub)
+        # Match code, Arabic name or English name (case-insensitive substring)
+        results = [pub for pub, fields in entries if any(query in field for field in fields)]
         
         logger.info(f"Found {len(results)} results")
         return results
@@ -150,24 +206,7 @@ class HallManager:
 
     def get_adjacent_publishers(self, hall_number: int, section: str, code: str) -> List[Dict]:
         """Get publishers adjacent to the given publisher."""
-        section_pubs = self.get_section_publishers(hall_number, section)
-        
-        # Find the index of the current publisher
-        current_idx = -1
-        for i, pub in enumerate(section_pubs):
-            if pub['code'].lower() == code.lower():
-                current_idx = i
-                break
-        
-        if current_idx == -1:
-            return []
-        
-        # Get up to 2 publishers before and after the current one
-        start_idx = max(0, current_idx - 2)
-        end_idx = min(len(section_pubs), current_idx + 3)
-        
-        adjacent = section_pubs[start_idx:current_idx] + section_pubs[current_idx + 1:end_idx]
-        return adjacent
+        return self._adjacent_publishers.get((hall_number, section.lower(), code.lower()), [])
 
     def format_publisher_info(self, publisher: dict, include_neighbors: bool = False) -> str:
         """Format publisher information for display with proper RTL alignment."""
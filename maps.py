@@ -1,6 +1,54 @@
-from typing import Dict, List, Optional
 import io
-import os
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import cairosvg  # For converting SVG to PNG
+from PIL import Image, ImageDraw
+
+# resvg is a faster (Rust) rasterizer than CairoSVG; optional
+try:
+    import resvg_py
+except ImportError:
+    resvg_py = None
+
+logger = logging.getLogger(__name__)
+
+# The rasterizing functions below run in the bot's render worker processes, so
+# this module must stay importable without side effects
+
+def encode_png(image: Image.Image) -> bytes:
+    """Encode a map as a 256-colour palette PNG."""
+    # Rasterizers write 32-bit RGBA, but the maps are a few flat colours on white,
+    # so a palette PNG is a fraction of the size to upload
+    image = image.convert("RGB").quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", compress_level=6)
+    return buffer.getvalue()
+
+# Cached in each worker process, so highlighting booths reuses its hall's base map
+@lru_cache(maxsize=8)
+def rasterize_svg(svg_content: str) -> bytes:
+    """Convert an SVG document to PNG bytes."""
+    if resvg_py is not None:
+        png_bytes = bytes(resvg_py.svg_to_bytes(svg_string=svg_content))
+    else:
+        png_bytes = cairosvg.svg2png(bytestring=svg_content.encode("utf-8"))
+    return encode_png(Image.open(io.BytesIO(png_bytes)))
+
+def highlight_booths(svg_content: str, boxes: List[Tuple[float, float, float, float]]) -> bytes:
+    """
+    Draw booth highlights over a hall's rasterized base map: the rest of the map
+    is faded and each booth outlined in gold.
+    """
+    base = Image.open(io.BytesIO(rasterize_svg(svg_content))).convert("RGB")
+    image = Image.blend(Image.new("RGB", base.size, "white"), base, 0.3)
+    draw = ImageDraw.Draw(image)
+    for x, y, width, height in boxes:
+        box = (round(x), round(y), round(x + width), round(y + height))
+        image.paste(base.crop(box), box[:2])
+        draw.rectangle((box[0] - 3, box[1] - 3, box[2] + 3, box[3] + 3), outline="#ffd700", width=3)
+    return encode_png(image)
 
 class MapManager:
     def __init__(self):
@@ -27,16 +75,6 @@ class MapManager:
                     opacity: 0.8; 
                     cursor: pointer; 
                 }
-                .booth.highlighted { 
-                    stroke: #ffd700;  /* Gold stroke */
-                    stroke-width: 3; 
-                    filter: drop-shadow(0 0 5px rgba(255, 215, 0, 0.7));
-                    opacity: 1;
-                }
-                .booth-dimmed { 
-                    opacity: 0.3;  /* More dimmed */
-                    filter: grayscale(30%);
-                }
                 .booth-label { 
                     font-family: Arial, sans-serif; 
                     font-size: 12px; 
@@ -62,23 +100,51 @@ class MapManager:
             </style>
         """
 
-    def create_hall_map(self, hall_number: int, publishers: List[Dict], highlight_code: Optional[str] = None) -> str:
+    def _layout(self, publishers: List[Dict]) -> Tuple[float, float, float]:
+        """Get the (min_x, min_y, scale) that fit a hall's booths onto the map."""
+        # Calculate bounds for scaling
+        x_coords = [float(p['position']['x']) for p in publishers]
+        y_coords = [float(p['position']['y']) for p in publishers]
+        min_x = min(x_coords)
+        max_x = max(x_coords)
+        min_y = min(y_coords)
+        max_y = max(y_coords)
+        
+        # Calculate scaling factors to fit the map
+        content_width = max_x - min_x + 100  # Add padding
+        content_height = max_y - min_y + 100  # Add padding
+        scale_x = (self.svg_width - 2 * self.margin) / content_width
+        scale_y = (self.svg_height - 2 * self.margin) / content_height
+        scale = min(scale_x, scale_y)  # Use the same scale for both axes
+        return min_x, min_y, scale
+
+    def get_booth_boxes(self, publishers: List[Dict], code: str) -> List[Tuple[float, float, float, float]]:
+        """Get the (x, y, width, height) on the map of each booth with this code."""
+        try:
+            min_x, min_y, scale = self._layout(publishers)
+            boxes = []
+            for pub in publishers:
+                if pub.get('code', '') != code:
+                    continue
+                width = float(pub['width']) * scale
+                height = float(pub['height']) * scale
+                if pub.get('is_circle', False):
+                    width = height = min(width, height)
+                boxes.append((
+                    (float(pub['position']['x']) - min_x) * scale + self.margin,
+                    (float(pub['position']['y']) - min_y) * scale + self.margin,
+                    width,
+                    height
+                ))
+            return boxes
+        except Exception as e:
+            logger.error(f"Error locating booth {code}: {e}")
+            return []
+
+    def create_hall_map(self, hall_number: int, publishers: List[Dict]) -> str:
         """Create an SVG map visualization for a specific hall."""
         try:
-            # Calculate bounds for scaling
-            x_coords = [float(p['position']['x']) for p in publishers]
-            y_coords = [float(p['position']['y']) for p in publishers]
-            min_x = min(x_coords)
-            max_x = max(x_coords)
-            min_y = min(y_coords)
-            max_y = max(y_coords)
-            
-            # Calculate scaling factors to fit the map
-            content_width = max_x - min_x + 100  # Add padding
-            content_height = max_y - min_y + 100  # Add padding
-            scale_x = (self.svg_width - 2 * self.margin) / content_width
-            scale_y = (self.svg_height - 2 * self.margin) / content_height
-            scale = min(scale_x, scale_y)  # Use the same scale for both axes
+            min_x, min_y, scale = self._layout(publishers)
             
             # Function to transform coordinates
             def transform(x: float, y: float) -> tuple[float, float]:
@@ -136,49 +202,25 @@ class MapManager:
                     # Transform booth coordinates
                     booth_x, booth_y = transform(x, y)
                     
-                    # Determine booth classes
-                    classes = ['booth']
-                    if highlight_code:
-                        if code == highlight_code:
-                            classes.append('highlighted')
-                            # Add glow effect for highlighted booth
-                            svg.append(
-                                f'<rect x="{booth_x-5}" y="{booth_y-5}" '
-                                f'width="{width+10}" height="{height+10}" '
-                                'class="highlight-glow"/>'
-                            )
-                        else:
-                            classes.append('booth-dimmed')
-                    
                     # Draw booth - always as rectangle unless explicitly marked as circle
                     if pub.get('is_circle', False):  # Only circles if explicitly marked
                         radius = min(width, height) / 2
                         svg.append(
                             f'<circle cx="{booth_x + radius}" cy="{booth_y + radius}" r="{radius}" '
-                            f'class="{" ".join(classes)}" fill="{color}">'
+                            f'class="booth" fill="{color}">'
                             f'<title>{pub.get("nameAr", "")} ({code})</title></circle>'
                         )
                     else:  # Default to rectangle
                         svg.append(
                             f'<rect x="{booth_x}" y="{booth_y}" width="{width}" height="{height}" '
-                            f'class="{" ".join(classes)}" fill="{color}">'
+                            f'class="booth" fill="{color}">'
                             f'<title>{pub.get("nameAr", "")} ({code})</title></rect>'
                         )
                     
-                    # Make highlighted booth's label more prominent
-                    label_classes = ['booth-label']
-                    if highlight_code and code == highlight_code:
-                        label_classes.append('highlighted')
-                        svg.append(
-                            f'<text x="{booth_x + width/2}" y="{booth_y + height/2}" '
-                            f'class="{" ".join(label_classes)}" '
-                            f'style="font-weight: bold; font-size: 14px">{code}</text>'
-                        )
-                    else:
-                        svg.append(
-                            f'<text x="{booth_x + width/2}" y="{booth_y + height/2}" '
-                            f'class="{" ".join(label_classes)}">{code}</text>'
-                        )
+                    svg.append(
+                        f'<text x="{booth_x + width/2}" y="{booth_y + height/2}" '
+                        f'class="booth-label">{code}</text>'
+                    )
             
             # Close SVG
             svg.append('</svg>')
@@ -186,35 +228,13 @@ class MapManager:
             return '\n'.join(svg)
             
         except Exception as e:
-            print(f"Error creating map: {e}")
+            logger.error(f"Error creating map: {e}")
             return None
 
     def get_hall_info(self, hall_number: int) -> Optional[Dict]:
         """Get information about a specific hall."""
         return self.halls.get(hall_number)
 
-    def save_hall_map(self, hall_number: int, publishers: List[Dict], highlight_code: str = None, output_dir: str = "maps") -> Optional[str]:
-        """Generate and save a hall map as SVG file."""
-        try:
-            # Create output directory if it doesn't exist
-            os.makedirs(output_dir, exist_ok=True)
-            
-            # Generate SVG
-            svg_content = self.create_hall_map(hall_number, publishers, highlight_code)
-            if not svg_content:
-                return None
-            
-            # Save to file
-            output_path = os.path.join(output_dir, f"hall{hall_number}.svg")
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(svg_content)
-            
-            return output_path
-            
-        except Exception as e:
-            print(f"Error saving map: {e}")
-            return None
-
     def get_section_publishers(self, hall_number: int, section: str, publishers: List[Dict]) -> List[Dict]:
         """Get all publishers in a specific hall section."""
         return [p for p in publishers 
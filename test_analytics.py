@@ -100,6 +100,29 @@ class TestGA4Analytics(unittest.TestCase):
         self.assertEqual(payload['events'][0]['params']['customEvent:publisher_name'], 'Test Publisher')
         self.assertEqual(payload['events'][0]['params']['customEvent:feature_name'], 'bookmarks')
 
+    @patch('requests.post')
+    def test_background_sender_batches_events(self, mock_post):
+        """Test queued events are sent in batches grouped by user."""
+        mock_post.return_value.status_code = 204
+        self.analytics.is_production = True
+        
+        # The interval never elapses and the batch never fills, so every event
+        # waits in one batch until stop_background_sender() flushes it
+        self.analytics.start_background_sender(flush_interval=60, batch_size=50)
+        for _ in range(30):
+            self.analytics.track_feature_use(user_id=self.test_user_id, feature="maps")
+        self.analytics.track_feature_use(user_id="other_user", feature="search")
+        self.analytics.stop_background_sender()
+        
+        # 30 events for one user split at the 25-event limit, plus one for the other user
+        payloads = [call[1]['json'] for call in mock_post.call_args_list]
+        events_per_client = {}
+        for p in payloads:
+            self.assertLessEqual(len(p['events']), 25)
+            events_per_client[p['client_id']] = events_per_client.get(p['client_id'], 0) + len(p['events'])
+        self.assertEqual(events_per_client, {self.test_user_id: 30, "other_user": 1})
+        self.assertEqual(len(payloads), 3)
+
 class TestGA4Live(unittest.TestCase):
     """Live integration tests for GA4 functionality."""
     
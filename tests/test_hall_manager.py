@@ -0,0 +1,95 @@
+"""
+Tests for HallManager publisher search.
+"""
+
+import os
+import unittest
+
+from halls.hall_manager import HallManager, normalize_search_text
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class TestSearchPublishers(unittest.TestCase):
+    """Unit tests for HallManager.search_publishers against the bundled hall data."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Load the hall data once (HallManager reads "halls/" relative to the cwd)."""
+        cwd = os.getcwd()
+        os.chdir(REPO_ROOT)
+        try:
+            cls.hall_manager = HallManager()
+        finally:
+            os.chdir(cwd)
+        cls.all_publishers = [
+            pub for pubs in cls.hall_manager.halls.values() for pub in pubs
+        ]
+
+    def linear_search(self, query):
+        """Reference results: a plain substring scan over every publisher."""
+        query = normalize_search_text(query).strip()
+        return [
+            pub for pub in self.all_publishers
+            if any(
+                query in normalize_search_text(pub.get(field) or '')
+                for field in ('code', 'nameAr', 'nameEn')
+            )
+        ]
+
+    def assertSameResults(self, results, expected):
+        self.assertCountEqual([id(pub) for pub in results], [id(pub) for pub in expected])
+
+    def test_name_substring(self):
+        """Test that an Arabic name substring finds every publisher containing it."""
+        results = self.hall_manager.search_publishers('دار')
+        self.assertTrue(results)
+        self.assertTrue(all('دار' in normalize_search_text(pub['nameAr']) for pub in results))
+        self.assertSameResults(results, self.linear_search('دار'))
+
+    def test_code(self):
+        """Test that a publisher code matches case-insensitively."""
+        results = self.hall_manager.search_publishers('a41')
+        self.assertIn('A41', [pub['code'] for pub in results])
+        self.assertSameResults(results, self.linear_search('A41'))
+
+    def test_short_queries(self):
+        """Test 1 and 2 character queries, which bypass the trigram index."""
+        for query in ('د', 'دا', 'A'):
+            with self.subTest(query=query):
+                results = self.hall_manager.search_publishers(query)
+                self.assertTrue(results)
+                self.assertSameResults(results, self.linear_search(query))
+
+    def test_hall_number(self):
+        """Test that "قاعة N" lists every publisher in hall N."""
+        for hall_number, pubs in self.hall_manager.halls.items():
+            with self.subTest(hall=hall_number):
+                results = self.hall_manager.search_publishers(f'قاعة {hall_number}')
+                self.assertEqual(len(results), self.hall_manager.hall_counts[hall_number])
+                self.assertSameResults(results, pubs)
+
+    def test_diacritics_and_hamza(self):
+        """Test that diacritics and hamza/madda alef forms don't affect matching."""
+        self.assertSameResults(
+            self.hall_manager.search_publishers('دَار'),
+            self.hall_manager.search_publishers('دار')
+        )
+        hamza_results = self.hall_manager.search_publishers('إصدارات')
+        self.assertTrue(hamza_results)
+        self.assertSameResults(hamza_results, self.hall_manager.search_publishers('اصدارات'))
+
+    def test_max_search_length_is_normalized(self):
+        """Test that a diacritized name longer than max_search_length still matches once normalized."""
+        longest = max(self.all_publishers, key=lambda pub: len(pub.get('nameAr') or ''))
+        query = '\u064E'.join(longest['nameAr'])
+        self.assertGreater(len(query), self.hall_manager.max_search_length)
+        self.assertLessEqual(len(normalize_search_text(query)), self.hall_manager.max_search_length)
+        self.assertIn(longest, self.hall_manager.search_publishers(query))
+
+    def test_empty_and_unmatched(self):
+        """Test that empty and unmatched queries return no results."""
+        self.assertEqual(self.hall_manager.search_publishers(''), [])
+        self.assertEqual(self.hall_manager.search_publishers('zzzzqqq'), [])
+
+if __name__ == '__main__':
+    unittest.main()